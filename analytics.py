@@ -0,0 +1,218 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from models import User, Order, Crop, FarmerDailyStats, FarmerDailyCropStats, FarmerBuyerStats, OrderStatusCount
+
+# Order status -> FarmerDailyStats counter bumped when an order enters it
+STATUS_COUNTERS = {
+    'pending': 'orders_received',
+    'accepted': 'orders_accepted',
+    'rejected': 'orders_rejected',
+    'delivered': 'orders_delivered',
+    'paid': 'orders_paid',
+}
+UPSERT_INSERTS = {'postgresql': pg_insert, 'sqlite': sqlite_insert}
+
+
+def _increment(model, keys, deltas):
+    """Add deltas to the rollup row identified by keys, creating it if needed"""
+    insert = UPSERT_INSERTS.get(db.engine.dialect.name)
+    if insert is not None:
+        stmt = insert(model).values(**keys, **deltas)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: getattr(model, name) + stmt.excluded[name] for name in deltas},
+        )
+        db.session.execute(stmt)
+        return
+
+    row = model.query.filter_by(**keys).with_for_update().first()
+    if row is None:
+        db.session.add(model(**keys, **deltas))
+    else:
+        for name, delta in deltas.items():
+            setattr(row, name, getattr(row, name) + delta)
+
+
+def _record_sale(order, crop_name, day):
+    """Bump crop and buyer rollups for a paid order; returns the daily deltas"""
+    _increment(FarmerDailyCropStats, {'farmer_id': order.farmer_id, 'day': day, 'crop_name': crop_name},
+               {'quantity': order.quantity, 'revenue': order.total_amount, 'orders': 1})
+    _increment(FarmerBuyerStats, {'farmer_id': order.farmer_id, 'buyer_id': order.buyer_id},
+               {'revenue': order.total_amount, 'quantity': order.quantity, 'orders': 1})
+    return {'revenue': order.total_amount, 'quantity_sold': order.quantity}
+
+
+def _first_time(order_id, status, when):
+    """Mark status as counted for the order; False if it already was"""
+    insert = UPSERT_INSERTS.get(db.engine.dialect.name)
+    if insert is not None:
+        stmt = insert(OrderStatusCount).values(order_id=order_id, status=status, created_at=when)
+        return db.session.execute(stmt.on_conflict_do_nothing()).rowcount > 0
+
+    if OrderStatusCount.query.filter_by(order_id=order_id, status=status).with_for_update().first():
+        return False
+    db.session.add(OrderStatusCount(order_id=order_id, status=status, created_at=when))
+    return True
+
+
+def record_status_change(order, old_status, new_status, when=None):
+    """Update the farmer's rollups for an order entering new_status.
+
+    Call before committing the status change so both land in one
+    transaction. Each status is counted at most once per order, so moving
+    an order back and forth (e.g. paid -> delivered -> paid) doesn't count
+    it, or its sale, twice. Orders are received only when created.
+    """
+    if old_status == new_status or new_status not in STATUS_COUNTERS:
+        return
+    if new_status == 'pending' and old_status is not None:
+        return
+    when = when or datetime.utcnow()
+    if not _first_time(order.id, new_status, when):
+        return
+    day = when.date()
+
+    deltas = {STATUS_COUNTERS[new_status]: 1}
+    if new_status == 'delivered' and order.created_at:
+        deltas['fulfillment_seconds'] = (when - order.created_at).total_seconds()
+        deltas['fulfilled_count'] = 1
+    if new_status == 'paid':
+        deltas.update(_record_sale(order, order.crop.name, day))
+
+    _increment(FarmerDailyStats, {'farmer_id': order.farmer_id, 'day': day}, deltas)
+
+
+def record_order_created(order):
+    record_status_change(order, None, 'pending', order.created_at)
+
+
+def backfill(batch_size=1000):
+    """Add order history the rollups haven't counted yet, e.g. after upgrading.
+
+    Only (order, status) pairs without an OrderStatusCount row are added;
+    everything counted incrementally is left alone, so running this again
+    changes nothing. Status history isn't stored, so an uncounted order is
+    received on its created day and enters its current status on its last
+    update day; fulfillment time is only known for orders marked delivered.
+    Returns the number of (order, status) pairs added.
+    """
+    daily, crops, buyers = {}, {}, {}
+    added = 0
+
+    def bump(table, key, deltas):
+        row = table.setdefault(key, {})
+        for name, delta in deltas.items():
+            row[name] = row.get(name, 0) + delta
+
+    rows = db.session.execute(
+        select(Order.id, Order.farmer_id, Order.buyer_id, Order.status, Order.quantity, Order.total_amount,
+               Order.created_at, Order.updated_at, Crop.name)
+        .join(Crop, Order.crop_id == Crop.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+    for batch in rows.partitions():
+        counted = set(db.session.execute(
+            select(OrderStatusCount.order_id, OrderStatusCount.status)
+            .where(OrderStatusCount.order_id.in_([row.id for row in batch]))
+        ).all())
+        new_counts = []
+
+        for order in batch:
+            if (order.id, 'pending') not in counted:
+                bump(daily, (order.farmer_id, order.created_at.date()), {'orders_received': 1})
+                new_counts.append({'order_id': order.id, 'status': 'pending', 'created_at': order.created_at})
+
+            counter = STATUS_COUNTERS.get(order.status)
+            if order.status == 'pending' or counter is None or (order.id, order.status) in counted:
+                continue
+            updated = order.updated_at or order.created_at
+            new_counts.append({'order_id': order.id, 'status': order.status, 'created_at': updated})
+            day = updated.date()
+            deltas = {counter: 1}
+            if order.status == 'delivered':
+                deltas['fulfillment_seconds'] = (updated - order.created_at).total_seconds()
+                deltas['fulfilled_count'] = 1
+            if order.status == 'paid':
+                deltas.update({'revenue': order.total_amount, 'quantity_sold': order.quantity})
+                bump(crops, (order.farmer_id, day, order.name),
+                     {'quantity': order.quantity, 'revenue': order.total_amount, 'orders': 1})
+                bump(buyers, (order.farmer_id, order.buyer_id),
+                     {'revenue': order.total_amount, 'quantity': order.quantity, 'orders': 1})
+            bump(daily, (order.farmer_id, day), deltas)
+
+        if new_counts:
+            db.session.execute(insert(OrderStatusCount), new_counts)
+            added += len(new_counts)
+
+    for (farmer_id, day), deltas in daily.items():
+        _increment(FarmerDailyStats, {'farmer_id': farmer_id, 'day': day}, deltas)
+    for (farmer_id, day, crop_name), deltas in crops.items():
+        _increment(FarmerDailyCropStats, {'farmer_id': farmer_id, 'day': day, 'crop_name': crop_name}, deltas)
+    for (farmer_id, buyer_id), deltas in buyers.items():
+        _increment(FarmerBuyerStats, {'farmer_id': farmer_id, 'buyer_id': buyer_id}, deltas)
+    db.session.commit()
+    return added
+
+
+def farmer_analytics(farmer_id, days=30, top_buyers=5):
+    """Summary for the farmer dashboard, read from rollup tables only"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+
+    daily_rows = FarmerDailyStats.query.filter(
+        FarmerDailyStats.farmer_id == farmer_id, FarmerDailyStats.day >= since
+    ).order_by(FarmerDailyStats.day).all()
+
+    crop_rows = db.session.query(
+        FarmerDailyCropStats.crop_name,
+        func.sum(FarmerDailyCropStats.quantity),
+        func.sum(FarmerDailyCropStats.revenue),
+        func.sum(FarmerDailyCropStats.orders),
+    ).filter(
+        FarmerDailyCropStats.farmer_id == farmer_id, FarmerDailyCropStats.day >= since
+    ).group_by(FarmerDailyCropStats.crop_name).order_by(func.sum(FarmerDailyCropStats.revenue).desc()).all()
+
+    buyer_rows = db.session.query(
+        FarmerBuyerStats.buyer_id, User.username, FarmerBuyerStats.revenue,
+        FarmerBuyerStats.quantity, FarmerBuyerStats.orders
+    ).join(User, FarmerBuyerStats.buyer_id == User.id).filter(
+        FarmerBuyerStats.farmer_id == farmer_id
+    ).order_by(FarmerBuyerStats.revenue.desc()).limit(top_buyers).all()
+
+    totals = {name: 0 for name in ('revenue', 'quantity_sold', 'fulfillment_seconds', 'fulfilled_count',
+                                   *STATUS_COUNTERS.values())}
+    for row in daily_rows:
+        for name in totals:
+            totals[name] += getattr(row, name)
+    fulfilled = totals.pop('fulfilled_count')
+    fulfillment_seconds = totals.pop('fulfillment_seconds')
+    totals['avg_fulfillment_hours'] = round(fulfillment_seconds / fulfilled / 3600, 1) if fulfilled else None
+
+    return {
+        'days': days,
+        'totals': totals,
+        'daily': [{
+            'day': row.day.isoformat(),
+            'revenue': row.revenue,
+            'quantity_sold': row.quantity_sold,
+            'orders_received': row.orders_received,
+            'orders_paid': row.orders_paid,
+        } for row in daily_rows],
+        'crops': [{
+            'crop_name': name,
+            'quantity': quantity,
+            'revenue': revenue,
+            'orders': orders,
+        } for name, quantity, revenue, orders in crop_rows],
+        # FarmerBuyerStats has no daily breakdown, so this ignores ?days=
+        'top_buyers_all_time': [{
+            'buyer_id': buyer_id,
+            'buyer_name': username,
+            'revenue': revenue,
+            'quantity': quantity,
+            'orders': orders,
+        } for buyer_id, username, revenue, quantity, orders in buyer_rows],
+    }
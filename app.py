@@ -1,11 +1,17 @@
 import os
 import logging
+import click
 from dotenv import load_dotenv
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager
+from db_routing import RoutingSession, REPLICA_BIND_KEY
+from json_provider import FastJSONProvider
+from compression import init_compression, precompress_static
+from ratelimit import init_rate_limiting
+from passwords import init_password_hashing
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -16,13 +22,14 @@ load_dotenv()
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 login_manager = LoginManager()
 
 # create the app
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
 
 # configure the database
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -33,23 +40,117 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
     "pool_pre_ping": True,
 }
+
+# optional read replica; safe GET routes opt in via db_routing.replica_reads
+replica_url = os.environ.get("DATABASE_REPLICA_URL")
+if replica_url:
+    app.config["SQLALCHEMY_BINDS"] = {REPLICA_BIND_KEY: replica_url}
+# seconds a user keeps reading from the primary after writing
+app.config["DATABASE_REPLICA_STICKY_SECONDS"] = int(os.environ.get("DATABASE_REPLICA_STICKY_SECONDS", "5"))
 app.config["UPLOAD_FOLDER"] = "static/uploads"
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max file size
+app.config["CROPS_PAGE_SIZE"] = 24  # dashboard cards rendered per page
+# rate limit buckets: "memory" (per worker), "sqlite:///path" (shared on one host) or "redis://..."
+app.config["RATELIMIT_STORAGE"] = os.environ.get("RATELIMIT_STORAGE", "memory")
+# password hashing cost (Werkzeug method string) and the process pool that runs it
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+app.config["PASSWORD_HASH_MAX_PENDING"] = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "16"))
 
 # initialize extensions
 db.init_app(app)
 login_manager.init_app(app)
 login_manager.login_view = 'login'  # type: ignore[attr-defined]
 login_manager.login_message = 'Please log in to access this page.'
+init_compression(app)
+init_rate_limiting(app)
+init_password_hashing(app)
 
 with app.app_context():
     import models, routes
-    db.create_all()
-    routes.init_admin_user()
+
+def startup():
+    """One-time setup for a process that serves requests.
+
+    Kept out of import so CLI commands, benchmarks and multiprocessing
+    workers can import the app without creating tables, seeding the admin,
+    building the price book or rewriting static files.
+    """
+    with app.app_context():
+        db.create_all()
+        models.upgrade_schema()
+        routes.init_admin_user()
+        routes.price_book.start(app)
+    if app.config["COMPRESS_STATIC_ON_STARTUP"]:
+        try:
+            written = precompress_static(app.static_folder)
+            logging.info(f"Precompressed {written} static asset variants")
+        except OSError as e:
+            logging.error(f"Failed to precompress static assets: {e}")
 
 @app.cli.command("init-db")
 def init_db_command():
-    """Creates database tables and initializes the admin user."""
+    """Creates database tables, adds new columns and initializes the admin user."""
     db.create_all()
+    models.upgrade_schema()
     routes.init_admin_user()
     print("Initialized the database and created admin user.")
+
+@app.cli.command("backfill-analytics")
+def backfill_analytics_command():
+    """Adds order history not yet counted in the farmer sales rollups."""
+    import analytics
+    added = analytics.backfill()
+    print(f"Backfilled {added} uncounted order statuses into the analytics rollups.")
+
+@app.cli.command("export")
+@click.argument("kind", type=click.Choice(["orders", "transactions", "users"]))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), default="csv")
+@click.option("--start", help="Earliest created date, YYYY-MM-DD.")
+@click.option("--end", help="Latest created date, YYYY-MM-DD (inclusive).")
+@click.option("--status", help="Status to filter on (user type for users).")
+@click.option("--output", type=click.File("w"), default="-", help="File to write (default stdout).")
+def export_command(kind, fmt, start, end, status, output):
+    """Streams orders, transactions or users as CSV or JSONL."""
+    import exports
+    try:
+        start, end = exports.parse_date(start), exports.parse_date(end)
+    except ValueError:
+        raise click.BadParameter("dates must be YYYY-MM-DD")
+    for chunk in exports.stream_export(kind, fmt, start, end, status):
+        output.write(chunk)
+
+@app.cli.command("prune-changelog")
+@click.option("--days", default=30, show_default=True, help="Keep this many days of sync history.")
+def prune_changelog_command(days):
+    """Deletes old sync change log entries; clients older than that resync."""
+    from datetime import datetime, timedelta
+    import sync
+    deleted = sync.prune(datetime.utcnow() - timedelta(days=days))
+    print(f"Deleted {deleted} change log entries.")
+
+@app.cli.command("compress-static")
+def compress_static_command():
+    """Writes gzip/brotli variants of compressible static assets."""
+    written = precompress_static(app.static_folder)
+    print(f"Wrote {written} precompressed static files.")
+
+@app.cli.command("sync-replica")
+def sync_replica_command():
+    """Copies the primary SQLite database into the replica file (local testing)."""
+    import sqlite3
+    engines = db.engines
+    replica = engines.get(REPLICA_BIND_KEY)
+    if replica is None:
+        print("DATABASE_REPLICA_URL is not set.")
+        return
+    if db.engine.url.get_backend_name() != "sqlite" or replica.url.get_backend_name() != "sqlite":
+        print("sync-replica only supports SQLite primary and replica files.")
+        return
+    src = sqlite3.connect(db.engine.url.database)
+    dst = sqlite3.connect(replica.url.database)
+    with dst:
+        src.backup(dst)
+    src.close()
+    dst.close()
+    print(f"Copied {db.engine.url.database} to {replica.url.database}.")
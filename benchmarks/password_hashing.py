@@ -0,0 +1,54 @@
+"""Logins/sec for one worker, hashing inline vs on the process pool.
+
+Simulates a threaded gunicorn worker (gthread) handling a login storm while
+also serving cheap requests, and reports login throughput plus the latency
+of the cheap requests. Run from the project root:
+
+    python benchmarks/password_hashing.py [logins] [threads] [pool_workers]
+"""
+import os
+import sys
+import time
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher, DEFAULT_METHOD
+
+
+def light_request():
+    # Stand-in for a cheap page render
+    start = time.perf_counter()
+    sum(i * i for i in range(20000))
+    return time.perf_counter() - start
+
+
+def run(label, hasher, pwhash, logins, threads):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        start = time.perf_counter()
+        login_futures = [executor.submit(hasher.verify, pwhash, 'correct horse') for _ in range(logins)]
+        light_futures = [executor.submit(light_request) for _ in range(logins)]
+        assert all(f.result() for f in login_futures)
+        elapsed = time.perf_counter() - start
+        latencies = sorted(f.result() for f in light_futures)
+
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<24} {logins / elapsed:>8.1f} logins/sec   "
+          f"cheap request median {statistics.median(latencies) * 1000:>6.1f} ms, p95 {p95 * 1000:>6.1f} ms")
+
+
+if __name__ == '__main__':
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    method = os.environ.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD)
+
+    inline = PasswordHasher(method=method, workers=0)
+    pooled = PasswordHasher(method=method, workers=workers, max_pending=logins)
+    pwhash = inline.hash('correct horse')
+
+    pooled.verify(pwhash, 'correct horse')  # start the pool outside the timing
+    run('inline (before)', inline, pwhash, logins, threads)
+    run(f'process pool x{workers} (after)', pooled, pwhash, logins, threads)
+    pooled.shutdown()
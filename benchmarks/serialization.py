@@ -0,0 +1,76 @@
+"""Compare crop list serialization: ORM hydration + stdlib json vs projection.
+
+Run from the project root:
+
+    python benchmarks/serialization.py [number_of_crops]
+"""
+import os
+import sys
+import json
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import app, db
+from models import User, Crop
+from serializers import CROP_LIST
+
+
+def seed(n):
+    farmers = [User(username=f'farmer{i}', email=f'farmer{i}@example.com', password_hash='x',
+                    user_type='farmer', county='Nakuru') for i in range(50)]
+    db.session.add_all(farmers)
+    db.session.flush()
+    db.session.add_all([Crop(farmer_id=farmers[i % 50].id, name=f'Maize {i}', category='Cereals',
+                             quantity=100 + i, unit='kg', price_per_unit=35.0 + i % 10,
+                             location='Nakuru', county='Nakuru', harvest_date=date(2024, 1, 1))
+                        for i in range(n)])
+    db.session.commit()
+
+
+def orm_path():
+    crops = Crop.query.filter_by(status='available').order_by(Crop.created_at.desc()).all()
+    return json.dumps({'crops': [{
+        'id': crop.id,
+        'farmer_id': crop.farmer_id,
+        'name': crop.name,
+        'category': crop.category,
+        'quantity': crop.quantity,
+        'unit': crop.unit,
+        'price_per_unit': crop.price_per_unit,
+        'location': crop.location,
+        'county': crop.county,
+        'farmer_name': crop.farmer.username,
+        'farmer_rating': crop.farmer.rating,
+        'image_filename': crop.image_filename,
+        'harvest_date': crop.harvest_date.isoformat() if crop.harvest_date else None,
+        'quality_grade': crop.quality_grade
+    } for crop in crops]})
+
+
+def projection_path(fields):
+    stmt = CROP_LIST.select(fields).where(Crop.status == 'available').order_by(Crop.created_at.desc())
+    return app.json.dumps({'crops': CROP_LIST.serialize(db.session.execute(stmt), fields)})
+
+
+def bench(label, fn, n, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<32} {n / best:>12,.0f} rows/sec")
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with app.app_context():
+        db.create_all()
+        seed(n)
+        bench('ORM + json (current)', orm_path, n)
+        bench('projection, all fields', lambda: projection_path(CROP_LIST.default), n)
+        bench('projection, ?fields=id,name,price',
+              lambda: projection_path(['id', 'name', 'price_per_unit']), n)
@@ -0,0 +1,124 @@
+import os
+import gzip
+import mimetypes
+from flask import request, send_from_directory
+from werkzeug.http import generate_etag
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'application/manifest+json',
+    'text/html', 'text/css', 'text/javascript', 'text/plain', 'text/xml',
+    'image/svg+xml',
+}
+STATIC_EXTENSIONS = {'.css', '.js', '.json', '.html', '.svg', '.txt', '.xml'}
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def _negotiate():
+    """Pick the best encoding the client accepts: brotli, then gzip"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted.quality('br') > 0:
+        return 'br'
+    if accepted.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def _compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level['br'])
+    return gzip.compress(data, compresslevel=level['gzip'], mtime=0)
+
+
+def compress_response(app, response):
+    """Compress dynamic responses and give them a per-encoding ETag"""
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+
+    # Strong ETag over the uncompressed body so caches can revalidate
+    etag = None
+    if request.method in ('GET', 'HEAD'):
+        etag = response.get_etag()[0] or generate_etag(data)
+
+    encoding = None
+    if len(data) >= app.config['COMPRESS_MIN_SIZE']:
+        encoding = _negotiate()
+    if encoding:
+        response.set_data(_compress(data, encoding, app.config['COMPRESS_LEVEL']))
+        response.headers['Content-Encoding'] = encoding
+
+    if etag:
+        # Each encoding is a different representation and needs its own tag
+        response.set_etag(f'{etag}-{encoding}' if encoding else etag)
+        response.make_conditional(request)
+    return response
+
+
+def precompress_static(static_folder, level=None):
+    """Write .gz/.br siblings for compressible static assets that are stale"""
+    level = level or {'gzip': 9, 'br': 11}
+    written = 0
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if os.path.splitext(name)[1] not in STATIC_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            mtime = os.path.getmtime(path)
+            with open(path, 'rb') as f:
+                data = f.read()
+            for encoding, suffix in SUFFIXES.items():
+                if encoding == 'br' and brotli is None:
+                    continue
+                target = path + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+                    continue
+                # Other workers may be serving target right now; swap the whole
+                # file in at once so they never see a partly written one
+                tmp = f'{target}.{os.getpid()}.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(_compress(data, encoding, level))
+                os.replace(tmp, target)
+                written += 1
+    return written
+
+
+def init_compression(app):
+    """Register response compression and the precompressed static view"""
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_LEVEL', {'gzip': 6, 'br': 4})
+    app.config.setdefault('COMPRESS_STATIC_ON_STARTUP', True)  # used by app.startup()
+
+    def send_static(filename):
+        mimetype = mimetypes.guess_type(filename)[0]
+        encoding = _negotiate() if mimetype in COMPRESSIBLE_MIMETYPES else None
+        if encoding:
+            original = safe_join(app.static_folder, filename)
+            candidate = safe_join(app.static_folder, filename + SUFFIXES[encoding])
+            if (original and candidate and os.path.isfile(original) and os.path.isfile(candidate)
+                    and os.path.getmtime(candidate) >= os.path.getmtime(original)):
+                response = send_from_directory(app.static_folder, filename + SUFFIXES[encoding],
+                                               mimetype=mimetype,
+                                               max_age=app.get_send_file_max_age(filename))
+                response.headers['Content-Encoding'] = encoding
+                response.vary.add('Accept-Encoding')
+                return response
+
+        response = app.send_static_file(filename)
+        if mimetype in COMPRESSIBLE_MIMETYPES:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    app.view_functions['static'] = send_static
+    app.after_request(lambda response: compress_response(app, response))
@@ -0,0 +1,97 @@
+import time
+from functools import wraps
+from flask import g, request, session, has_request_context, current_app
+from flask_sqlalchemy.session import Session as _FlaskSession
+from sqlalchemy import event
+
+REPLICA_BIND_KEY = 'replica'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+CONSISTENCY_HEADER = 'X-Read-Consistency'
+_PRIMARY_UNTIL_KEY = '_db_primary_until'
+
+
+class RoutingSession(_FlaskSession):
+    """Session that sends opted-in reads to the replica bind.
+
+    Anything that writes (flushes, DML statements) or runs outside a request
+    that opted in always goes to the primary engine.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+
+        primary = super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+        if self._flushing or getattr(clause, 'is_dml', False):
+            return primary
+        if not _replica_allowed():
+            return primary
+
+        replica = self._db.engines.get(REPLICA_BIND_KEY)
+        # Only tables living on the default bind are replicated
+        if replica is None or primary is not self._db.engines.get(None):
+            return primary
+        return replica
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_write(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_after_write(db_session):
+    if not db_session.info.pop('wrote', False):
+        return
+    # Without a replica there is nothing to pin to, and no reason to set a cookie
+    if has_request_context() and REPLICA_BIND_KEY in db_session._db.engines:
+        pin_to_primary()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(db_session):
+    db_session.info.pop('wrote', None)
+
+
+def _replica_allowed():
+    """Decide whether the current request may read from the replica"""
+    if not has_request_context():
+        return False
+    if request.method not in SAFE_METHODS:
+        return False
+    if g.get('db_use_primary'):
+        return False
+
+    consistency = request.headers.get(CONSISTENCY_HEADER, '').lower()
+    if consistency == 'strong':
+        return False
+    if not g.get('db_use_replica') and consistency != 'eventual':
+        return False
+
+    # Read-your-own-writes: stay on the primary for a while after a write
+    if session.get(_PRIMARY_UNTIL_KEY, 0) > time.time():
+        return False
+    return True
+
+
+def replica_reads(f):
+    """Route decorator opting safe (GET/HEAD) requests into replica reads"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        g.db_use_replica = True
+        return f(*args, **kwargs)
+    return decorated
+
+
+def use_primary():
+    """Force the rest of the current request onto the primary"""
+    g.db_use_primary = True
+
+
+def pin_to_primary(seconds=None):
+    """Keep the current user's reads on the primary after a write"""
+    if seconds is None:
+        seconds = current_app.config.get('DATABASE_REPLICA_STICKY_SECONDS', 5)
+    if seconds > 0:
+        session[_PRIMARY_UNTIL_KEY] = time.time() + seconds
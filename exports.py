@@ -0,0 +1,87 @@
+import io
+import csv
+import json
+from datetime import date, datetime, timedelta
+from sqlalchemy import select
+from app import db
+from models import User, Order, Transaction
+
+CHUNK_SIZE = 64 * 1024  # bytes of output buffered per yielded chunk
+BATCH_SIZE = 1000  # rows fetched per round trip from the server-side cursor
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+# Spreadsheets evaluate cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# name -> (columns, date column filtered by start/end, column filtered by status)
+EXPORTS = {
+    'orders': ([
+        Order.id, Order.buyer_id, Order.farmer_id, Order.crop_id, Order.quantity, Order.total_amount,
+        Order.status, Order.delivery_address, Order.delivery_date, Order.created_at, Order.updated_at,
+    ], Order.created_at, Order.status),
+    'transactions': ([
+        Transaction.id, Transaction.order_id, Transaction.amount, Transaction.transaction_fee,
+        Transaction.payment_method, Transaction.transaction_id, Transaction.status,
+        Transaction.created_at, Transaction.completed_at, Transaction.escrow_released,
+    ], Transaction.created_at, Transaction.status),
+    'users': ([
+        User.id, User.username, User.email, User.phone_number, User.user_type, User.is_admin,
+        User.county, User.created_at, User.rating, User.total_ratings,
+    ], User.created_at, User.user_type),
+}
+
+
+def parse_date(value):
+    """Parse an optional YYYY-MM-DD filter, raising ValueError when malformed"""
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def build_query(name, start=None, end=None, status=None):
+    """SELECT for an export, filtered by created date range (inclusive) and status"""
+    columns, date_column, status_column = EXPORTS[name]
+    stmt = select(*columns)
+    if start:
+        stmt = stmt.where(date_column >= start)
+    if end:
+        stmt = stmt.where(date_column < end + timedelta(days=1))
+    if status:
+        stmt = stmt.where(status_column == status)
+    return stmt.order_by(columns[0])
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _csv_cell(value):
+    """Plain value, with text a spreadsheet would run as a formula prefixed by '"""
+    value = _plain(value)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_export(name, fmt='csv', start=None, end=None, status=None):
+    """Yield the export as text chunks, holding only one batch in memory"""
+    columns = [column.key for column in EXPORTS[name][0]]
+    stmt = build_query(name, start, end, status).execution_options(yield_per=BATCH_SIZE)
+    rows = db.session.execute(stmt)
+
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        write = lambda row: writer.writerow([_csv_cell(value) for value in row])
+    else:
+        write = lambda row: buffer.write(json.dumps(dict(zip(columns, map(_plain, row)))) + '\n')
+
+    for row in rows:
+        write(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
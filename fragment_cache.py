@@ -0,0 +1,60 @@
+from collections import OrderedDict
+from threading import Lock
+from flask import render_template
+from markupsafe import Markup
+
+
+class FragmentCache:
+    """Bounded LRU of rendered template fragments.
+
+    Keys include a version, so an edited record simply misses the cache and
+    the stale entry ages out.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get_or_render(self, key, render):
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+                return fragment
+
+        fragment = render()
+
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+def crop_version(crop):
+    """Version stamp for a crop; changes whenever the row is updated"""
+    stamp = crop.updated_at or crop.created_at
+    return stamp.isoformat() if stamp else None
+
+
+def render_crop_card(crop, variant):
+    """Render (or reuse) the dashboard card for a crop.
+
+    variant is 'buyer' or 'farmer'. Buyer cards show the farmer's name and
+    rating, which live on the user row, so they are part of the key too.
+    """
+    key = (variant, crop.id, crop_version(crop))
+    if variant == 'buyer':
+        key += (crop.farmer.username, crop.farmer.rating)
+    return fragment_cache.get_or_render(
+        key, lambda: Markup(render_template(f'partials/crop_card_{variant}.html', crop=crop))
+    )
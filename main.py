@@ -1,4 +1,8 @@
-from app import app
+# Multiprocessing workers (the password hashing pool) re-run this file as
+# __mp_main__; they must not import, let alone boot, the app
+if __name__ != '__mp_main__':
+    from app import app, startup
+    startup()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
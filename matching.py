@@ -0,0 +1,172 @@
+import math
+import time
+from collections import namedtuple
+from threading import Lock
+from app import db
+from models import Demand, Message
+
+ANY = None
+# Demands are bucketed by max price on a log scale, ~25% wide bands
+BAND_RATIO = 1.25
+
+# Spellings of the listing form's units (kg, tons, bags, pieces)
+UNIT_ALIASES = {
+    'kgs': 'kg', 'kilogram': 'kg', 'kilograms': 'kg',
+    'ton': 'tons', 'tonne': 'tons', 'tonnes': 'tons',
+    'bag': 'bags',
+    'piece': 'pieces',
+}
+
+DemandEntry = namedtuple('DemandEntry', 'id buyer_id crop_name category county grade unit max_price')
+
+
+def price_band(price):
+    return int(math.floor(math.log(max(price, 0.01), BAND_RATIO)))
+
+
+def _norm(value):
+    value = (value or '').strip().lower()
+    return value or ANY
+
+
+def _norm_unit(unit):
+    unit = _norm(unit)
+    return UNIT_ALIASES.get(unit, unit)
+
+
+class DemandIndex:
+    """In-memory inverted indexes over open buyer demands.
+
+    Demands are indexed by category (split into price bands), county and
+    quality grade, so matching a new crop only touches demands that share
+    its most selective attribute instead of scanning every open demand.
+    Other workers' changes are picked up by an incremental refresh keyed
+    on Demand.updated_at.
+    """
+
+    def __init__(self, refresh_seconds=30):
+        self.refresh_seconds = refresh_seconds
+        self._demands = {}
+        self._by_category = {}  # category -> {band: {ids}}
+        self._by_county = {}  # county or ANY -> {ids}
+        self._by_grade = {}  # grade or ANY -> {ids}
+        self._lock = Lock()
+        self._built = False
+        self._refreshed_at = 0.0
+        self._watermark = None
+
+    @staticmethod
+    def _entry(demand):
+        return DemandEntry(demand.id, demand.buyer_id, _norm(demand.crop_name), _norm(demand.category),
+                           _norm(demand.county), _norm(demand.quality_grade), _norm_unit(demand.unit),
+                           demand.max_price)
+
+    def _add(self, entry):
+        self._remove(entry.id)
+        self._demands[entry.id] = entry
+        bands = self._by_category.setdefault(entry.category, {})
+        bands.setdefault(price_band(entry.max_price), set()).add(entry.id)
+        self._by_county.setdefault(entry.county, set()).add(entry.id)
+        self._by_grade.setdefault(entry.grade, set()).add(entry.id)
+
+    def _remove(self, demand_id):
+        entry = self._demands.pop(demand_id, None)
+        if entry is None:
+            return
+        self._by_category[entry.category][price_band(entry.max_price)].discard(demand_id)
+        self._by_county[entry.county].discard(demand_id)
+        self._by_grade[entry.grade].discard(demand_id)
+
+    def update(self, demand):
+        """Index, re-index or drop a demand after it was saved"""
+        with self._lock:
+            if demand.status == 'open':
+                self._add(self._entry(demand))
+            else:
+                self._remove(demand.id)
+
+    def build(self):
+        demands = Demand.query.filter_by(status='open').all()
+        with self._lock:
+            self._demands.clear()
+            self._by_category.clear()
+            self._by_county.clear()
+            self._by_grade.clear()
+            for demand in demands:
+                self._add(self._entry(demand))
+            self._watermark = max((d.updated_at for d in demands if d.updated_at), default=None)
+            self._built = True
+            self._refreshed_at = time.monotonic()
+
+    def refresh(self):
+        """Apply demands created, edited or closed since the last refresh"""
+        if not self._built:
+            return self.build()
+        query = Demand.query
+        if self._watermark is not None:
+            query = query.filter(Demand.updated_at >= self._watermark)
+        changed = query.all()
+        for demand in changed:
+            self.update(demand)
+            if demand.updated_at and (self._watermark is None or demand.updated_at > self._watermark):
+                self._watermark = demand.updated_at
+        self._refreshed_at = time.monotonic()
+
+    def ensure_fresh(self):
+        if not self._built or time.monotonic() - self._refreshed_at > self.refresh_seconds:
+            self.refresh()
+
+    def match(self, crop):
+        """Open demands a newly listed crop satisfies.
+
+        Prices are only comparable per the same unit, so the units must
+        agree. Quantity is deliberately not filtered on: buyers often fill
+        a large demand from several smaller listings, so a listing for
+        less than the demanded quantity still matches.
+        """
+        self.ensure_fresh()
+        category, county, grade = _norm(crop.category), _norm(crop.county), _norm(crop.quality_grade)
+        unit = _norm_unit(crop.unit)
+        name = _norm(crop.name) or ''
+        price = crop.price_per_unit or 0
+        band = price_band(price)
+
+        with self._lock:
+            # Candidates from whichever index narrows things down the most
+            bands = self._by_category.get(category, {})
+            category_ids = [ids for b, ids in bands.items() if b >= band]
+            county_ids = [self._by_county.get(county, ()), self._by_county.get(ANY, ())]
+            grade_ids = [self._by_grade.get(grade, ()), self._by_grade.get(ANY, ())]
+            driver = min((category_ids, county_ids, grade_ids), key=lambda sets: sum(len(s) for s in sets))
+
+            matches = []
+            for ids in driver:
+                for demand_id in ids:
+                    entry = self._demands[demand_id]
+                    if entry.category != category or entry.unit != unit or entry.max_price < price:
+                        continue
+                    if entry.county not in (ANY, county) or entry.grade not in (ANY, grade):
+                        continue
+                    if entry.crop_name and entry.crop_name not in name:
+                        continue
+                    matches.append(entry)
+        return matches
+
+
+demand_index = DemandIndex()
+
+
+def notify_matches(crop, matches):
+    """Tell each matched buyer about the new listing via an inbox message"""
+    buyers = {entry.buyer_id for entry in matches if entry.buyer_id != crop.farmer_id}
+    if not buyers:
+        return 0
+    content = (f"New listing matches your demand: {crop.quantity} {crop.unit} of {crop.name} "
+               f"(Grade {crop.quality_grade}) in {crop.county or crop.location} at "
+               f"KSh {crop.price_per_unit:.2f}/{crop.unit}. View it at /crop/{crop.id}")
+    db.session.add_all([
+        Message(sender_id=crop.farmer_id, receiver_id=buyer_id, content=content, message_type='system')
+        for buyer_id in buyers
+    ])
+    db.session.commit()
+    return len(buyers)
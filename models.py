@@ -1,7 +1,9 @@
 from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
 from app import db, login_manager
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password, password_needs_rehash
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -30,10 +32,13 @@ class User(UserMixin, db.Model):
     received_messages = db.relationship('Message', backref='receiver', lazy=True, foreign_keys='Message.receiver_id')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_needs_rehash(self.password_hash)
 
 class Crop(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -51,6 +56,7 @@ class Crop(db.Model):
     image_filename = db.Column(db.String(200))
     status = db.Column(db.String(20), default='available')  # available, sold, expired
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     quality_grade = db.Column(db.String(10), default='A')  # A, B, C
     
     # Relationships
@@ -96,6 +102,95 @@ class Message(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     read_at = db.Column(db.DateTime)
     
+class Demand(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    crop_name = db.Column(db.String(100))  # optional, matched against crop names
+    category = db.Column(db.String(50), nullable=False)
+    county = db.Column(db.String(100))  # None matches any county
+    quality_grade = db.Column(db.String(10))  # None matches any grade
+    quantity = db.Column(db.Float, nullable=False)
+    unit = db.Column(db.String(20), nullable=False)
+    max_price = db.Column(db.Float, nullable=False)  # per unit
+    status = db.Column(db.String(20), default='open', index=True)  # open, fulfilled, cancelled
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    # Relationships
+    buyer = db.relationship('User', backref=db.backref('demands', lazy=True))
+
+class Review(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), unique=True, nullable=False)  # one review per order
+    farmer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    rating = db.Column(db.Integer, nullable=False)  # 1-5
+    comment = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    order = db.relationship('Order', backref=db.backref('review', uselist=False))
+    buyer = db.relationship('User', foreign_keys=[buyer_id])
+    
+class FarmerDailyStats(db.Model):
+    """Per-farmer daily sales rollup, maintained incrementally by analytics.py"""
+    __table_args__ = (db.UniqueConstraint('farmer_id', 'day'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    farmer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    quantity_sold = db.Column(db.Float, nullable=False, default=0.0)
+    orders_received = db.Column(db.Integer, nullable=False, default=0)
+    orders_accepted = db.Column(db.Integer, nullable=False, default=0)
+    orders_rejected = db.Column(db.Integer, nullable=False, default=0)
+    orders_delivered = db.Column(db.Integer, nullable=False, default=0)
+    orders_paid = db.Column(db.Integer, nullable=False, default=0)
+    fulfillment_seconds = db.Column(db.Float, nullable=False, default=0.0)  # sum over delivered orders
+    fulfilled_count = db.Column(db.Integer, nullable=False, default=0)
+
+class FarmerDailyCropStats(db.Model):
+    __table_args__ = (db.UniqueConstraint('farmer_id', 'day', 'crop_name'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    farmer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    crop_name = db.Column(db.String(100), nullable=False)
+    quantity = db.Column(db.Float, nullable=False, default=0.0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+
+class FarmerBuyerStats(db.Model):
+    __table_args__ = (db.UniqueConstraint('farmer_id', 'buyer_id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    farmer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    quantity = db.Column(db.Float, nullable=False, default=0.0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+
+class OrderStatusCount(db.Model):
+    """Order statuses already counted in the rollups, so each is counted once per order"""
+    __table_args__ = (db.UniqueConstraint('order_id', 'status'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # when the order entered status
+
+class ChangeLog(db.Model):
+    """Append-only log of crop/order/message changes; ids are sync tokens"""
+    __table_args__ = {'sqlite_autoincrement': True}  # never reuse ids after a prune
+    
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # crop, order, message
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # upsert, delete
+    user_id = db.Column(db.Integer, index=True)  # None means visible to everyone
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
 class MarketPrice(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     crop_name = db.Column(db.String(100), nullable=False)
@@ -111,3 +206,28 @@ class Location(db.Model):
     market_name = db.Column(db.String(100))
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
+
+# Columns added to tables that already existed; db.create_all() never alters
+# an existing table, so upgrade_schema() adds these (and backfills them)
+ADDED_COLUMNS = [
+    (Crop.__table__.c.updated_at, 'created_at'),
+    (OrderStatusCount.__table__.c.created_at, None),  # unknown for rows counted before it existed
+]
+
+def upgrade_schema():
+    """Add any ADDED_COLUMNS missing from the database; safe to run repeatedly"""
+    for column, backfill_from in ADDED_COLUMNS:
+        table = column.table.name
+        if column.name in {c['name'] for c in inspect(db.engine).get_columns(table)}:
+            continue
+        column_type = column.type.compile(dialect=db.engine.dialect)
+        try:
+            db.session.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column.name} {column_type}'))
+            if backfill_from is not None:
+                db.session.execute(text(f'UPDATE "{table}" SET {column.name} = {backfill_from}'))
+            db.session.commit()
+        except SQLAlchemyError:
+            # Another worker starting at the same time may have added it first
+            db.session.rollback()
+            if column.name not in {c['name'] for c in inspect(db.engine).get_columns(table)}:
+                raise
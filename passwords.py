@@ -0,0 +1,105 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app, has_request_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+def _mp_context():
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    ctx = multiprocessing.get_context('forkserver')
+    # The default preload imports __main__ into the fork server, which would
+    # boot the whole app there; hashing only needs werkzeug
+    ctx.set_forkserver_preload(['werkzeug.security'])
+    return ctx
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when too many hashes are already queued for the pool"""
+
+
+class PasswordHasher:
+    """Runs Werkzeug password hashing on a bounded process pool.
+
+    Hashing is CPU-bound, so doing it on the request thread stalls the
+    worker during login spikes. Jobs go to at most ``workers`` processes,
+    and at most ``max_pending`` may wait; beyond that callers get
+    PasswordHashingBusy instead of piling up. ``workers=0`` hashes inline.
+    """
+
+    def __init__(self, method=DEFAULT_METHOD, workers=2, max_pending=16, timeout=5.0):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending) if workers else None
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._prefix = None
+
+    def _executor(self):
+        with self._lock:
+            # A pool inherited across a gunicorn fork has no live workers
+            if self._pool is None or self._pid != os.getpid():
+                # Forking a multi-threaded server can copy a held lock into the
+                # child; forkserver starts workers from a clean process instead
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+                self._pid = os.getpid()
+            return self._pool
+
+    def _run(self, fn, *args, offload=True):
+        if not offload or not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHashingBusy()
+        try:
+            return self._executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password, offload=True):
+        return self._run(generate_password_hash, password, self.method, offload=offload)
+
+    def verify(self, pwhash, password, offload=True):
+        return self._run(check_password_hash, pwhash, password, offload=offload)
+
+    def needs_rehash(self, pwhash):
+        """True if pwhash was made with different cost parameters than configured"""
+        if self._prefix is None:
+            # Let Werkzeug expand short names like 'scrypt' into their full parameters
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._prefix
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+def init_password_hashing(app):
+    app.config.setdefault('PASSWORD_HASH_METHOD', DEFAULT_METHOD)
+    app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+    app.config.setdefault('PASSWORD_HASH_MAX_PENDING', 16)
+    app.extensions['password_hasher'] = PasswordHasher(
+        method=app.config['PASSWORD_HASH_METHOD'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+    )
+
+
+def hash_password(password):
+    # Only requests are offloaded; boot and CLI commands hash inline
+    return current_app.extensions['password_hasher'].hash(password, offload=has_request_context())
+
+
+def verify_password(pwhash, password):
+    return current_app.extensions['password_hasher'].verify(pwhash, password, offload=has_request_context())
+
+
+def password_needs_rehash(pwhash):
+    return current_app.extensions['password_hasher'].needs_rehash(pwhash)
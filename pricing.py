@@ -0,0 +1,265 @@
+import os
+import time
+from threading import Lock, Thread
+import numpy as np
+from flask import current_app
+from sqlalchemy import select, func, exists, and_, or_
+from sqlalchemy.orm import aliased
+from app import db
+from models import Crop, Order, MarketPrice, OrderStatusCount
+
+ANY = '*'
+# Orders in these states were agreed by both sides, so their price is a real sale
+ACCEPTED_STATUSES = ('accepted', 'delivered', 'paid')
+# Platform sales reflect actual clearing prices, so they count more than market surveys
+PLATFORM_WEIGHT = 2.0
+# Fall back to a broader segment when a narrow one has fewer samples than this
+MIN_SAMPLES = 3
+
+
+def _norm(value):
+    return (value or '').strip().lower()
+
+
+def segment_keys(crop_name, county, grade):
+    """Keys from most to least specific that an observation contributes to"""
+    name = _norm(crop_name)
+    county = _norm(county) or ANY
+    keys = []
+    if grade:
+        keys.append(f'{name}|{county}|{grade.strip().upper()}')
+    keys.append(f'{name}|{county}|{ANY}')
+    keys.append(f'{name}|{ANY}|{ANY}')
+    return keys
+
+
+def aggregate(keys, prices):
+    """Vectorized per-key [count, sum, sum of squares, min, max]"""
+    if not keys:
+        return {}
+    prices = np.asarray(prices, dtype=float)
+    uniq, inverse = np.unique(np.asarray(keys), return_inverse=True)
+    counts = np.bincount(inverse)
+    sums = np.bincount(inverse, weights=prices)
+    sumsq = np.bincount(inverse, weights=prices * prices)
+    mins = np.full(len(uniq), np.inf)
+    maxs = np.full(len(uniq), -np.inf)
+    np.minimum.at(mins, inverse, prices)
+    np.maximum.at(maxs, inverse, prices)
+    return {
+        str(key): [int(n), float(s), float(sq), float(lo), float(hi)]
+        for key, n, s, sq, lo, hi in zip(uniq, counts, sums, sumsq, mins, maxs)
+    }
+
+
+def _merge(table, key, price):
+    """Fold one price into a segment, swapping in a new list so readers never see half an update"""
+    stats = table.get(key)
+    if stats is None:
+        table[key] = [1, price, price * price, price, price]
+        return
+    n, s, sq, lo, hi = stats
+    table[key] = [n + 1, s + price, sq + price * price, min(lo, price), max(hi, price)]
+
+
+class PriceBook:
+    """In-memory per-segment price statistics for listing suggestions.
+
+    Built once in batch from MarketPrice history and accepted Orders, then
+    kept current incrementally by a background thread: new MarketPrice ids
+    and orders first accepted (per OrderStatusCount) since the last
+    watermark. Requests never touch the database; lookups are dict hits.
+    """
+
+    def __init__(self, refresh_seconds=60):
+        self.refresh_seconds = refresh_seconds
+        self.market = {}
+        self.platform = {}
+        self._lock = Lock()  # guards the tables
+        self._refresh_lock = Lock()  # one build/refresh at a time
+        self._built = False
+        self._app = None
+        self._pid = None
+        self._last_market_id = 0
+        self._accepted_until = None  # first-accepted time of the newest counted order
+        self._accepted_ties = set()  # orders counted at exactly that time
+
+    @staticmethod
+    def _order_columns(accepted_at):
+        return db.session.query(
+            Order.id, accepted_at, Order.quantity, Order.total_amount,
+            Crop.name, Crop.county, Crop.quality_grade
+        ).join(Crop, Order.crop_id == Crop.id).filter(
+            Order.status.in_(ACCEPTED_STATUSES), Order.quantity > 0
+        )
+
+    def _all_orders(self):
+        """Every accepted order, with when it was first accepted (None if unknown)"""
+        accepted_at = select(func.min(OrderStatusCount.created_at)).where(
+            OrderStatusCount.order_id == Order.id, OrderStatusCount.status.in_(ACCEPTED_STATUSES)
+        ).scalar_subquery()
+        return self._order_columns(accepted_at.label('accepted_at')).all()
+
+    def _newly_accepted(self):
+        """Orders whose first accepted status was recorded at or after the watermark"""
+        event, earlier = aliased(OrderStatusCount), aliased(OrderStatusCount)
+        first = ~exists().where(
+            earlier.order_id == event.order_id,
+            earlier.status.in_(ACCEPTED_STATUSES),
+            or_(earlier.created_at.is_(None), earlier.created_at < event.created_at,
+                and_(earlier.created_at == event.created_at, earlier.id < event.id)),
+        )
+        query = self._order_columns(event.created_at).join(event, event.order_id == Order.id).filter(
+            event.status.in_(ACCEPTED_STATUSES), event.created_at.isnot(None), first
+        )
+        if self._accepted_until is not None:
+            query = query.filter(event.created_at >= self._accepted_until)
+        return query.all()
+
+    def _advance(self, order_rows):
+        """Move the watermark past order_rows, remembering ties at the new watermark"""
+        for order_id, accepted_at, *_ in order_rows:
+            if accepted_at is None:
+                continue
+            if self._accepted_until is None or accepted_at > self._accepted_until:
+                self._accepted_until = accepted_at
+                self._accepted_ties = {order_id}
+            elif accepted_at == self._accepted_until:
+                self._accepted_ties.add(order_id)
+
+    def build(self):
+        """Recompute every segment from scratch"""
+        with self._refresh_lock:
+            self._build()
+
+    def _build(self):
+        market_rows = db.session.query(
+            MarketPrice.id, MarketPrice.crop_name, MarketPrice.location, MarketPrice.average_price
+        ).all()
+        order_rows = self._all_orders()
+
+        keys, prices = [], []
+        for _, name, location, price in market_rows:
+            for key in segment_keys(name, location, None):
+                keys.append(key)
+                prices.append(price)
+        market = aggregate(keys, prices)
+
+        keys, prices = [], []
+        for _, _, quantity, total, name, county, grade in order_rows:
+            for key in segment_keys(name, county, grade):
+                keys.append(key)
+                prices.append(total / quantity)
+        platform = aggregate(keys, prices)
+
+        with self._lock:
+            self.market = market
+            self.platform = platform
+            self._last_market_id = max((row[0] for row in market_rows), default=0)
+            self._accepted_until, self._accepted_ties = None, set()
+            self._advance(order_rows)
+            self._built = True
+
+    def refresh(self):
+        """Fold in market prices and newly accepted orders since the last refresh"""
+        with self._refresh_lock:
+            if not self._built:
+                return self._build()
+            self._refresh()
+
+    def _refresh(self):
+        market_rows = db.session.query(
+            MarketPrice.id, MarketPrice.crop_name, MarketPrice.location, MarketPrice.average_price
+        ).filter(MarketPrice.id > self._last_market_id).all()
+        # Rows at exactly the watermark may have been counted last time
+        order_rows = [row for row in self._newly_accepted()
+                      if not (row[1] == self._accepted_until and row[0] in self._accepted_ties)]
+
+        with self._lock:
+            for market_id, name, location, price in market_rows:
+                if market_id <= self._last_market_id:
+                    continue
+                for key in segment_keys(name, location, None):
+                    _merge(self.market, key, price)
+                self._last_market_id = max(self._last_market_id, market_id)
+            for _, _, quantity, total, name, county, grade in order_rows:
+                for key in segment_keys(name, county, grade):
+                    _merge(self.platform, key, total / quantity)
+            self._advance(order_rows)
+
+    def start(self, app):
+        """Build now and refresh every refresh_seconds on a daemon thread.
+
+        Called by the web server only; CLI commands never need the book.
+        """
+        self._app = app
+        self.build()
+        self._start_refresher(app)
+
+    def _start_refresher(self, app):
+        with self._lock:
+            # Threads don't survive a fork, so a worker forked from a
+            # preloaded master starts its own (the tables are inherited)
+            if self._pid == os.getpid():
+                return
+            self._app = app
+            self._pid = os.getpid()
+        Thread(target=self._run, name='price-book-refresh', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    self.refresh()  # builds first if this process hasn't yet
+            except Exception:
+                self._app.logger.exception('Price book refresh failed')
+            time.sleep(self.refresh_seconds)
+
+    def suggest(self, crop_name, county=None, grade=None):
+        """Suggested price per unit for a segment, or None without any data"""
+        if self._pid != os.getpid():
+            # Not started for this process (e.g. `flask run`): build in the background
+            self._start_refresher(current_app._get_current_object())
+        best = None
+        for key in segment_keys(crop_name, county, grade):
+            market = self.market.get(key)
+            platform = self.platform.get(key)
+            if not (market or platform):
+                continue
+            best = (key, market, platform)
+            samples = (market[0] if market else 0) + (platform[0] if platform else 0)
+            if samples >= MIN_SAMPLES:
+                break
+        return self._combine(*best) if best else None
+
+    @staticmethod
+    def _combine(key, market, platform):
+        weight = total = sumsq = 0.0
+        low, high = float('inf'), float('-inf')
+        for stats, source_weight in ((market, 1.0), (platform, PLATFORM_WEIGHT)):
+            if not stats:
+                continue
+            n, s, sq, lo, hi = stats
+            weight += source_weight * n
+            total += source_weight * s
+            sumsq += source_weight * sq
+            low, high = min(low, lo), max(high, hi)
+
+        mean = total / weight
+        std = max(sumsq / weight - mean * mean, 0.0) ** 0.5
+        name, county, grade = key.rsplit('|', 2)
+        return {
+            'crop_name': name,
+            'county': None if county == ANY else county,
+            'quality_grade': None if grade == ANY else grade,
+            'suggested_price': round(mean, 2),
+            'range_low': round(max(mean - std, low), 2),
+            'range_high': round(min(mean + std, high), 2),
+            'min_price': round(low, 2),
+            'max_price': round(high, 2),
+            'market_samples': market[0] if market else 0,
+            'platform_samples': platform[0] if platform else 0,
+        }
+
+
+price_book = PriceBook()
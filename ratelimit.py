@@ -0,0 +1,202 @@
+import math
+import time
+import sqlite3
+import threading
+from functools import wraps
+from flask import current_app, request, jsonify, make_response
+from flask_login import current_user
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_limit(limit):
+    """'60/minute' -> (tokens refilled per second, bucket capacity)"""
+    count, _, period = limit.partition('/')
+    count = int(count)
+    return count / PERIODS[period.strip()], count
+
+
+class MemoryBackend:
+    """Per-process token buckets; each gunicorn worker enforces its own budget"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def take(self, key, rate, capacity, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+
+            self._calls += 1
+            if self._calls % 10000 == 0:
+                self._prune(now)
+        return allowed, 0 if allowed else (cost - tokens) / rate
+
+    def _prune(self, now):
+        # Buckets idle for a day have long since refilled and carry no state
+        for key, (tokens, last) in list(self._buckets.items()):
+            if now - last > 86400:
+                del self._buckets[key]
+
+
+class SQLiteBackend:
+    """Token buckets in a SQLite file shared by all workers on one host.
+
+    A local stand-in for a shared backend such as Redis: every worker sees
+    the same budget, and BEGIN IMMEDIATE serializes the read-modify-write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # Connections are opened lazily per thread so none leak across a gunicorn fork
+        conn = sqlite3.connect(path, timeout=5)
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, ts REAL)')
+        conn.close()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, capacity, cost=1):
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, ts FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, last = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(now - last, 0) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, ts) VALUES (?, ?, ?)', (key, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, 0 if allowed else (cost - tokens) / rate
+
+
+class RedisBackend:
+    """Token buckets in Redis, shared by every worker and host"""
+
+    SCRIPT = """
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local rate, capacity, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local tokens = tonumber(bucket[1]) or capacity
+    local last = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(now - last, 0) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, capacity, cost=1):
+        allowed, tokens = self._script(keys=[f'ratelimit:{key}'], args=[rate, capacity, cost, time.time()])
+        allowed = bool(int(allowed))
+        return allowed, 0 if allowed else (cost - float(tokens)) / rate
+
+
+def create_backend(url):
+    """Backend from RATELIMIT_STORAGE: 'memory', 'sqlite:///path' or 'redis://...'"""
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisBackend(url)
+    return MemoryBackend()
+
+
+def init_rate_limiting(app):
+    app.config.setdefault('RATELIMIT_ENABLED', True)
+    app.config.setdefault('RATELIMIT_STORAGE', 'memory')
+    app.extensions['ratelimit'] = create_backend(app.config['RATELIMIT_STORAGE'])
+
+
+def _client_key(key):
+    if key == 'user' and current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    if key.startswith('field:'):
+        name = key[len('field:'):]
+        data = request.get_json(silent=True) if request.is_json else request.form
+        value = str(data.get(name) or '').strip().lower()[:64] if isinstance(data, dict) else ''
+        if value:
+            return f'ip:{request.remote_addr}:{name}:{value}'
+    return f'ip:{request.remote_addr}'
+
+
+def _reject(status, message, retry_after):
+    if request.is_json or request.path.startswith('/api/'):
+        response = make_response(jsonify({'success': False, 'message': message}), status)
+    else:
+        response = make_response(message, status)
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def rate_limit(limit, key='user', methods=None):
+    """Token-bucket budget for a route, e.g. @rate_limit('60/minute').
+
+    key is 'user' (falls back to the client IP when anonymous), 'ip', or
+    'field:<name>' for the client IP plus a submitted form/JSON field, so
+    people behind one carrier NAT address get separate budgets (e.g.
+    'field:username' at login). methods restricts the budget to some HTTP
+    methods (e.g. login POSTs). Stack decorators to combine budgets.
+    """
+    rate, capacity = parse_limit(limit)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if current_app.config['RATELIMIT_ENABLED'] and (methods is None or request.method in methods):
+                bucket = f'{request.endpoint}:{_client_key(key)}'
+                allowed, retry_after = current_app.extensions['ratelimit'].take(bucket, rate, capacity)
+                if not allowed:
+                    return _reject(429, 'Too many requests, please slow down', retry_after)
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+def concurrency_limit(max_concurrent, methods=None):
+    """Cap simultaneous executions of an expensive route within a worker.
+
+    methods restricts the cap to some HTTP methods (e.g. searches but not
+    the POST that creates a listing).
+    """
+    slots = threading.BoundedSemaphore(max_concurrent)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if methods is not None and request.method not in methods:
+                return f(*args, **kwargs)
+            if not slots.acquire(blocking=False):
+                return _reject(503, 'Server busy, please retry shortly', 1)
+            try:
+                return f(*args, **kwargs)
+            finally:
+                slots.release()
+        return decorated
+    return decorator
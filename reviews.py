@@ -0,0 +1,64 @@
+from sqlalchemy import update, func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import User, Review
+
+REVIEWABLE_STATUSES = ('delivered', 'paid')
+# Bayesian prior used when ranking by rating: a farmer with few reviews is
+# pulled towards an average rating instead of outranking well-reviewed ones
+PRIOR_RATING = 3.0
+PRIOR_WEIGHT = 5
+
+
+def save_review(order, rating, comment=None):
+    """Create or edit the review for an order and update the farmer's rating.
+
+    The running average is adjusted with a single UPDATE in the same
+    transaction, so it never rescans reviews and stays correct under
+    concurrent reviews of the same farmer. Returns (review, created).
+    """
+    review = Review.query.filter_by(order_id=order.id).with_for_update().first()
+
+    if review is None:
+        try:
+            return _create_review(order, rating, comment), True
+        except IntegrityError:
+            # A concurrent first review of this order inserted first; the
+            # rollback also undid our rating UPDATE, so apply this as an edit
+            db.session.rollback()
+            review = Review.query.filter_by(order_id=order.id).with_for_update().one()
+
+    delta = rating - review.rating
+    review.rating = rating
+    review.comment = comment
+    if delta:
+        db.session.execute(
+            update(User).where(User.id == order.farmer_id, User.total_ratings > 0).values(
+                rating=User.rating + float(delta) / User.total_ratings
+            )
+        )
+    db.session.commit()
+    return review, False
+
+
+def _create_review(order, rating, comment):
+    review = Review(order_id=order.id, farmer_id=order.farmer_id, buyer_id=order.buyer_id,
+                    rating=rating, comment=comment)
+    db.session.add(review)
+    # Flush first so a duplicate insert fails before the rating is touched
+    db.session.flush()
+    db.session.execute(
+        update(User).where(User.id == order.farmer_id).values(
+            rating=(func.coalesce(User.rating, 0.0) * func.coalesce(User.total_ratings, 0) + rating)
+            / (func.coalesce(User.total_ratings, 0) + 1),
+            total_ratings=func.coalesce(User.total_ratings, 0) + 1,
+        )
+    )
+    db.session.commit()
+    return review
+
+
+def rating_score():
+    """SQL expression ranking farmers by rating, weighted by review count"""
+    total = func.coalesce(User.total_ratings, 0)
+    return (func.coalesce(User.rating, 0.0) * total + PRIOR_RATING * PRIOR_WEIGHT) / (total + PRIOR_WEIGHT)
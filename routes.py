@@ -1,16 +1,36 @@
 import os
 import uuid
 from datetime import datetime, date
-from flask import render_template, request, jsonify, redirect, url_for, flash, current_app
+from flask import render_template, request, jsonify, redirect, url_for, flash, current_app, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy.orm import joinedload
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash
 from app import app, db
-from models import User, Crop, Order, Transaction, Message, MarketPrice, Location
+from models import User, Crop, Order, Transaction, Message, MarketPrice, Location, Review, Demand
 from utils import allowed_file, calculate_distance, get_market_prices
 from send_message import send_twilio_message
+from db_routing import replica_reads, use_primary
+from serializers import CROP_LIST, CROP_DETAIL, ORDER_LIST, USER_LIST
+from fragment_cache import render_crop_card
+from pricing import price_book
+from reviews import save_review, rating_score, REVIEWABLE_STATUSES
+from matching import demand_index, notify_matches
+from analytics import record_order_created, record_status_change, farmer_analytics
+from exports import EXPORTS, FORMATS, parse_date, stream_export
+from sync import snapshot, changes_since, parse_token
+from ratelimit import rate_limit, concurrency_limit
+from passwords import PasswordHashingBusy
 import logging
 
+def first_crop_page(crops_query, variant):
+    """Render the first page of dashboard crop cards; later pages come from /api/crops"""
+    per_page = app.config['CROPS_PAGE_SIZE']
+    crops = crops_query.options(joinedload(Crop.farmer)) \
+        .order_by(Crop.created_at.desc(), Crop.id.desc()).limit(per_page + 1).all()
+    cards = [render_crop_card(crop, variant) for crop in crops[:per_page]]
+    return cards, len(crops) > per_page
+
 @app.route('/')
 def index():
     recent_crops = Crop.query.filter_by(status='available').order_by(Crop.created_at.desc()).limit(6).all()
@@ -36,6 +56,7 @@ def init_admin_user():
         logging.info('Admin user created with username: admin, password: admin123')
 
 @app.route('/register', methods=['GET', 'POST'])
+@rate_limit('60/minute', key='ip', methods=['POST'])
 def register():
     if request.method == 'POST':
         data = request.get_json() if request.is_json else request.form
@@ -91,6 +112,8 @@ def register():
     return render_template('register.html')
 
 @app.route('/login', methods=['GET', 'POST'])
+@rate_limit('300/minute', key='ip', methods=['POST'])  # many users share one mobile carrier NAT address
+@rate_limit('10/minute', key='field:username', methods=['POST'])
 def login():
     if request.method == 'POST':
         data = request.get_json() if request.is_json else request.form
@@ -101,6 +124,10 @@ def login():
         user = User.query.filter_by(username=username).first()
         
         if user and user.check_password(password):
+            # Upgrade hashes made with old cost parameters while we have the password
+            if user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
             login_user(user)
             if request.is_json:
                 return jsonify({'success': True, 'redirect': url_for('farmer_dashboard' if user.user_type == 'farmer' else 'buyer_dashboard')})
@@ -147,31 +174,49 @@ def admin_dashboard():
 
 @app.route('/farmer/dashboard')
 @login_required
+@replica_reads
 def farmer_dashboard():
     if current_user.user_type != 'farmer':
         flash('Access denied')
         return redirect(url_for('index'))
     
-    crops = Crop.query.filter_by(farmer_id=current_user.id).order_by(Crop.created_at.desc()).all()
+    crop_cards, has_more_crops = first_crop_page(Crop.query.filter_by(farmer_id=current_user.id), 'farmer')
     orders = Order.query.filter_by(farmer_id=current_user.id).order_by(Order.created_at.desc()).limit(10).all()
     
-    return render_template('farmer_dashboard.html', crops=crops, orders=orders)
+    return render_template('farmer_dashboard.html', crop_cards=crop_cards,
+                           has_more_crops=has_more_crops, orders=orders)
+
+@app.route('/api/farmer/analytics')
+@login_required
+@replica_reads
+def get_farmer_analytics():
+    """Revenue, volume and top buyers for the current farmer, from daily rollups"""
+    if current_user.user_type != 'farmer':
+        return jsonify({'success': False, 'message': 'Only farmers have sales analytics'}), 403
+    
+    days = min(max(request.args.get('days', 30, type=int), 1), 365)
+    return jsonify(farmer_analytics(current_user.id, days))
 
 @app.route('/buyer/dashboard')
 @login_required
+@replica_reads
 def buyer_dashboard():
     if current_user.user_type != 'buyer':
         flash('Access denied')
         return redirect(url_for('index'))
     
-    # Get available crops with location-based sorting
-    crops = Crop.query.filter_by(status='available').all()
+    # First page of available crops; the rest are loaded on scroll
+    crop_cards, has_more_crops = first_crop_page(Crop.query.filter_by(status='available'), 'buyer')
     orders = Order.query.filter_by(buyer_id=current_user.id).order_by(Order.created_at.desc()).limit(10).all()
     
-    return render_template('buyer_dashboard.html', crops=crops, orders=orders)
+    return render_template('buyer_dashboard.html', crop_cards=crop_cards,
+                           has_more_crops=has_more_crops, orders=orders)
 
 @app.route('/api/crops', methods=['GET', 'POST'])
 @login_required
+@rate_limit('120/minute')
+@concurrency_limit(8, methods=['GET'])
+@replica_reads
 def handle_crops():
     if request.method == 'POST':
         if current_user.user_type != 'farmer':
@@ -204,10 +249,30 @@ def handle_crops():
         db.session.add(crop)
         db.session.commit()
         
+        # Notify buyers with matching standing demands
+        try:
+            notify_matches(crop, demand_index.match(crop))
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Failed to match demands for crop {crop.id}: {e}")
+        
         return jsonify({'success': True, 'message': 'Crop added successfully'})
     
     # GET request - search and filter crops
-    crops_query = Crop.query.filter_by(status='available')
+    try:
+        fields = CROP_LIST.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    # sort=rating ranks by farmer rating, computed in the same query
+    sort = request.args.get('sort')
+    joins = ('farmer',) if sort == 'rating' else ()
+    
+    if request.args.get('mine'):
+        # A farmer's own listings, whatever their status
+        crops_query = CROP_LIST.select(fields, joins).where(Crop.farmer_id == current_user.id)
+    else:
+        crops_query = CROP_LIST.select(fields, joins).where(Crop.status == 'available')
     
     # Apply filters
     category = request.args.get('category')
@@ -216,35 +281,100 @@ def handle_crops():
     search = request.args.get('search')
     
     if category:
-        crops_query = crops_query.filter(Crop.category == category)
+        crops_query = crops_query.where(Crop.category == category)
     if county:
-        crops_query = crops_query.filter(Crop.county == county)
+        crops_query = crops_query.where(Crop.county == county)
     if max_price:
-        crops_query = crops_query.filter(Crop.price_per_unit <= float(max_price))
+        crops_query = crops_query.where(Crop.price_per_unit <= float(max_price))
     if search:
-        crops_query = crops_query.filter(Crop.name.contains(search))
+        crops_query = crops_query.where(Crop.name.contains(search))
     
-    crops = crops_query.order_by(Crop.created_at.desc()).all()
+    if sort == 'rating':
+        crops_query = crops_query.order_by(rating_score().desc(), Crop.created_at.desc(), Crop.id.desc())
+    else:
+        crops_query = crops_query.order_by(Crop.created_at.desc(), Crop.id.desc())
+    
+    # Optional pagination for infinite scroll
+    page = request.args.get('page', type=int)
+    if page:
+        page = max(page, 1)
+        per_page = min(max(request.args.get('per_page', app.config['CROPS_PAGE_SIZE'], type=int), 1), 100)
+        rows = db.session.execute(crops_query.limit(per_page + 1).offset((page - 1) * per_page)).all()
+        return jsonify({
+            'crops': CROP_LIST.serialize(rows[:per_page], fields),
+            'page': page,
+            'has_more': len(rows) > per_page
+        })
+    
+    rows = db.session.execute(crops_query)
+    
+    return jsonify({'crops': CROP_LIST.serialize(rows, fields)})
+
+@app.route('/api/demands', methods=['GET', 'POST'])
+@login_required
+def handle_demands():
+    if current_user.user_type != 'buyer':
+        return jsonify({'success': False, 'message': 'Only buyers can post demands'})
+    
+    if request.method == 'POST':
+        data = request.get_json()
+        try:
+            quantity = float(data.get('quantity'))
+            max_price = float(data.get('max_price'))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'Quantity and max price must be numbers'})
+        
+        if not data.get('category') or not data.get('unit') or quantity <= 0 or max_price <= 0:
+            return jsonify({'success': False, 'message': 'Missing required fields'})
+        
+        demand = Demand(
+            buyer_id=current_user.id,
+            crop_name=data.get('crop_name') or None,
+            category=data.get('category'),
+            county=data.get('county') or None,
+            quality_grade=data.get('quality_grade') or None,
+            quantity=quantity,
+            unit=data.get('unit'),
+            max_price=max_price
+        )
+        
+        db.session.add(demand)
+        db.session.commit()
+        demand_index.update(demand)
+        
+        return jsonify({'success': True, 'demand_id': demand.id, 'message': 'Demand posted successfully'})
+    
+    demands = Demand.query.filter_by(buyer_id=current_user.id).order_by(Demand.created_at.desc()).all()
     
     return jsonify({
-        'crops': [{
-            'id': crop.id,
-            'farmer_id': crop.farmer_id,
-            'name': crop.name,
-            'category': crop.category,
-            'quantity': crop.quantity,
-            'unit': crop.unit,
-            'price_per_unit': crop.price_per_unit,
-            'location': crop.location,
-            'county': crop.county,
-            'farmer_name': crop.farmer.username,
-            'farmer_rating': crop.farmer.rating,
-            'image_filename': crop.image_filename,
-            'harvest_date': crop.harvest_date.isoformat() if crop.harvest_date else None,
-            'quality_grade': crop.quality_grade
-        } for crop in crops]
+        'demands': [{
+            'id': demand.id,
+            'crop_name': demand.crop_name,
+            'category': demand.category,
+            'county': demand.county,
+            'quality_grade': demand.quality_grade,
+            'quantity': demand.quantity,
+            'unit': demand.unit,
+            'max_price': demand.max_price,
+            'status': demand.status,
+            'created_at': demand.created_at.isoformat()
+        } for demand in demands]
     })
 
+@app.route('/api/demands/<int:demand_id>', methods=['DELETE'])
+@login_required
+def cancel_demand(demand_id):
+    demand = Demand.query.get_or_404(demand_id)
+    
+    if demand.buyer_id != current_user.id:
+        return jsonify({'success': False, 'message': 'Access denied'})
+    
+    demand.status = 'cancelled'
+    db.session.commit()
+    demand_index.update(demand)
+    
+    return jsonify({'success': True, 'message': 'Demand cancelled'})
+
 @app.route('/api/orders', methods=['GET', 'POST'])
 @login_required
 def handle_orders():
@@ -280,6 +410,8 @@ def handle_orders():
         )
         
         db.session.add(order)
+        db.session.flush()
+        record_order_created(order)
         db.session.commit()
         
         # Send SMS notification to farmer
@@ -293,24 +425,20 @@ def handle_orders():
         return jsonify({'success': True, 'order_id': order.id, 'message': 'Order placed successfully'})
     
     # GET request - get user's orders
+    try:
+        fields = ORDER_LIST.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    orders_query = ORDER_LIST.select(fields)
     if current_user.user_type == 'farmer':
-        orders = Order.query.filter_by(farmer_id=current_user.id).order_by(Order.created_at.desc()).all()
+        orders_query = orders_query.where(Order.farmer_id == current_user.id)
     else:
-        orders = Order.query.filter_by(buyer_id=current_user.id).order_by(Order.created_at.desc()).all()
+        orders_query = orders_query.where(Order.buyer_id == current_user.id)
     
-    return jsonify({
-        'orders': [{
-            'id': order.id,
-            'crop_name': order.crop.name,
-            'quantity': order.quantity,
-            'total_amount': order.total_amount,
-            'status': order.status,
-            'buyer_name': order.buyer.username,
-            'farmer_name': order.farmer.username,
-            'delivery_date': order.delivery_date.isoformat() if order.delivery_date else None,
-            'created_at': order.created_at.isoformat()
-        } for order in orders]
-    })
+    rows = db.session.execute(orders_query.order_by(Order.created_at.desc()))
+    
+    return jsonify({'orders': ORDER_LIST.serialize(rows, fields)})
 
 @app.route('/api/orders/<int:order_id>/status', methods=['PUT'])
 @login_required
@@ -330,6 +458,7 @@ def update_order_status(order_id):
     if new_status not in valid_statuses:
         return jsonify({'success': False, 'message': 'Invalid status'})
     
+    record_status_change(order, order.status, new_status)
     order.status = new_status
     order.updated_at = datetime.utcnow()
     
@@ -355,6 +484,61 @@ def update_order_status(order_id):
     
     return jsonify({'success': True, 'message': 'Order status updated successfully'})
 
+@app.route('/api/orders/<int:order_id>/review', methods=['POST'])
+@login_required
+def review_order(order_id):
+    """Create or edit the buyer's review of the farmer for a completed order"""
+    order = Order.query.get_or_404(order_id)
+    
+    if order.buyer_id != current_user.id:
+        return jsonify({'success': False, 'message': 'Access denied'})
+    if order.status not in REVIEWABLE_STATUSES:
+        return jsonify({'success': False, 'message': 'Only delivered or paid orders can be reviewed'})
+    
+    data = request.get_json()
+    try:
+        rating = int(data.get('rating'))
+    except (TypeError, ValueError):
+        rating = 0
+    if not 1 <= rating <= 5:
+        return jsonify({'success': False, 'message': 'Rating must be between 1 and 5'})
+    
+    review, created = save_review(order, rating, data.get('comment'))
+    
+    return jsonify({
+        'success': True,
+        'review_id': review.id,
+        'message': 'Review submitted successfully' if created else 'Review updated successfully'
+    })
+
+@app.route('/api/farmers/<int:farmer_id>/reviews')
+@login_required
+@replica_reads
+def farmer_reviews(farmer_id):
+    farmer = User.query.get_or_404(farmer_id)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = 20
+    
+    reviews = Review.query.options(joinedload(Review.buyer)).filter_by(farmer_id=farmer_id) \
+        .order_by(Review.created_at.desc()).limit(per_page + 1).offset((page - 1) * per_page).all()
+    
+    return jsonify({
+        'farmer_id': farmer.id,
+        'rating': farmer.rating,
+        'total_ratings': farmer.total_ratings,
+        'reviews': [{
+            'id': review.id,
+            'order_id': review.order_id,
+            'buyer_name': review.buyer.username,
+            'rating': review.rating,
+            'comment': review.comment,
+            'created_at': review.created_at.isoformat(),
+            'updated_at': review.updated_at.isoformat() if review.updated_at else None
+        } for review in reviews[:per_page]],
+        'page': page,
+        'has_more': len(reviews) > per_page
+    })
+
 @app.route('/conversation/<int:partner_id>')
 @login_required
 def view_conversation(partner_id):
@@ -398,6 +582,9 @@ def contact_admin():
 
 @app.route('/api/messages', methods=['GET', 'POST'])
 @login_required
+@rate_limit('120/minute')
+@concurrency_limit(8, methods=['GET'])
+@replica_reads
 def handle_messages():
     if request.method == 'POST':
         data = request.get_json()
@@ -423,6 +610,9 @@ def handle_messages():
     # GET request - get conversations with improved threading
     user_id = request.args.get('user_id')
     if user_id:
+        # Opening a thread marks messages read, so read from the primary
+        use_primary()
+        
         # Get conversation with specific user
         messages = Message.query.filter(
             ((Message.sender_id == current_user.id) & (Message.receiver_id == user_id)) |
@@ -501,7 +691,29 @@ def handle_messages():
         
         return jsonify({'conversations': list(conv_dict.values())})
 
+@app.route('/api/sync')
+@login_required
+@rate_limit('60/minute')
+@concurrency_limit(8)
+def sync_changes():
+    """Crops, orders and messages changed since the client's last sync token"""
+    # Always read the primary: a lagging replica could hand out a token past
+    # entries it hasn't received yet, and the client would skip them for good
+    since = request.args.get('since')
+    if not since:
+        return jsonify(snapshot(current_user))
+    
+    try:
+        since = parse_token(since)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid sync token'}), 400
+    
+    if isinstance(since, tuple):
+        return jsonify(snapshot(current_user, since))
+    return jsonify(changes_since(current_user, since))
+
 @app.route('/api/market-prices')
+@replica_reads
 def get_market_prices_api():
     crop_name = request.args.get('crop_name')
     location = request.args.get('location')
@@ -509,6 +721,22 @@ def get_market_prices_api():
     prices = get_market_prices(crop_name, location)
     return jsonify({'prices': prices})
 
+@app.route('/api/price-suggestion')
+@login_required
+@rate_limit('60/minute')
+@replica_reads
+def price_suggestion():
+    """Suggested listing price from market history and accepted platform orders"""
+    crop_name = request.args.get('crop_name')
+    if not crop_name:
+        return jsonify({'success': False, 'message': 'crop_name is required'}), 400
+    
+    suggestion = price_book.suggest(crop_name, request.args.get('county'), request.args.get('quality_grade'))
+    if not suggestion:
+        return jsonify({'success': False, 'message': 'No price data for this crop yet'})
+    
+    return jsonify({'success': True, 'suggestion': suggestion})
+
 @app.route('/crop/<int:crop_id>')
 def crop_details(crop_id):
     crop = Crop.query.get_or_404(crop_id)
@@ -518,26 +746,17 @@ def crop_details(crop_id):
 @login_required
 def get_crop_details(crop_id):
     """API endpoint to get crop details"""
-    crop = Crop.query.get(crop_id)
+    try:
+        fields = CROP_DETAIL.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    rows = db.session.execute(CROP_DETAIL.select(fields).where(Crop.id == crop_id))
+    crop = CROP_DETAIL.serialize(rows, fields)
     if not crop:
         return jsonify({'error': 'Crop not found'}), 404
     
-    return jsonify({
-        'id': crop.id,
-        'name': crop.name,
-        'category': crop.category,
-        'price_per_unit': float(crop.price_per_unit),
-        'unit': crop.unit,
-        'quantity': float(crop.quantity),
-        'location': crop.location,
-        'county': crop.county,
-        'description': crop.description,
-        'status': crop.status,
-        'farmer_id': crop.farmer_id,
-        'farmer_name': crop.farmer.username,
-        'harvest_date': crop.harvest_date.isoformat() if crop.harvest_date else None,
-        'image_filename': crop.image_filename
-    })
+    return jsonify(crop[0])
 
 @app.route('/orders')
 @login_required
@@ -586,6 +805,7 @@ def initiate_payment():
     # For now, simulate successful payment
     transaction.status = 'completed'
     transaction.completed_at = datetime.utcnow()
+    record_status_change(order, order.status, 'paid', transaction.completed_at)
     order.status = 'paid'
     
     db.session.commit()
@@ -604,18 +824,13 @@ def admin_manage_users():
         return jsonify({'success': False, 'message': 'Admin access required'}), 403
     
     if request.method == 'GET':
-        users = User.query.all()
-        return jsonify({
-            'users': [{
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'user_type': user.user_type,
-                'is_admin': user.is_admin,
-                'created_at': user.created_at.isoformat(),
-                'rating': user.rating
-            } for user in users]
-        })
+        try:
+            fields = USER_LIST.parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        rows = db.session.execute(USER_LIST.select(fields))
+        return jsonify({'users': USER_LIST.serialize(rows, fields)})
     
     elif request.method == 'POST':
         # Create new admin
@@ -656,6 +871,33 @@ def admin_manage_users():
         db.session.commit()
         return jsonify({'success': True, 'message': 'Admin privileges removed'})
 
+@app.route('/admin/export/<kind>')
+@login_required
+@rate_limit('10/hour')
+@replica_reads
+def admin_export(kind):
+    """Stream orders, transactions or users as CSV or JSONL"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    if kind not in EXPORTS:
+        return jsonify({'success': False, 'message': 'Unknown export'}), 404
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({'success': False, 'message': 'Format must be csv or jsonl'}), 400
+    try:
+        start = parse_date(request.args.get('start'))
+        end = parse_date(request.args.get('end'))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    
+    filename = f"{kind}-{datetime.utcnow():%Y%m%d}.{fmt}"
+    return Response(
+        stream_with_context(stream_export(kind, fmt, start, end, request.args.get('status'))),
+        mimetype=FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @app.route('/api/crops/<int:crop_id>/contact-farmer')
 @login_required
 def get_crop_farmer_contact(crop_id):
@@ -671,6 +913,14 @@ def get_crop_farmer_contact(crop_id):
 def not_found(error):
     return '<h1>404 - Page Not Found</h1><p>The page you are looking for does not exist.</p>', 404
 
+@app.errorhandler(PasswordHashingBusy)
+def hashing_busy(error):
+    # Login and register forms post JSON and expect a JSON reply
+    if request.is_json or request.path.startswith('/api/'):
+        return jsonify({'success': False, 'message': 'Too many sign-ins right now. Please try again in a moment.'}), \
+            503, {'Retry-After': '2'}
+    return '<h1>503 - Server Busy</h1><p>Too many sign-ins right now. Please try again in a moment.</p>', 503, {'Retry-After': '2'}
+
 @app.errorhandler(500)
 def internal_error(error):
     return '<h1>500 - Internal Server Error</h1><p>Something went wrong on our end.</p>', 500
@@ -0,0 +1,144 @@
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from models import User, Crop, Order, Message
+
+Buyer = aliased(User, name='buyer')
+Farmer = aliased(User, name='farmer')
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+class Projection:
+    """Column-level projection of a model for JSON APIs.
+
+    Selects only the requested columns as plain row tuples instead of
+    hydrating ORM objects, and turns them into dicts for ``jsonify``.
+    """
+
+    def __init__(self, base, fields, joins=None, default=None):
+        # fields: name -> (column, join name or None, formatter or None)
+        self.base = base
+        self.fields = fields
+        self.joins = joins or {}
+        self.default = list(default or fields)
+
+    def parse_fields(self, requested):
+        """Parse a ``?fields=a,b,c`` value, raising ValueError on unknown names"""
+        if not requested:
+            return self.default
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return names or self.default
+
+    def select(self, names, joins=()):
+        """Build a SELECT for just the named fields, joining only what they need
+
+        ``joins`` names extra joins needed by filters or ordering.
+        """
+        stmt = select(*[self.fields[name][0] for name in names]).select_from(self.base)
+        needed = list(joins)
+        for name in names:
+            join = self.fields[name][1]
+            if join and join not in needed:
+                needed.append(join)
+        for join in needed:
+            target, onclause = self.joins[join]
+            stmt = stmt.join(target, onclause)
+        return stmt
+
+    def serialize(self, rows, names):
+        """Turn result rows into dicts keyed by field name"""
+        formatters = [(i, self.fields[name][2]) for i, name in enumerate(names) if self.fields[name][2]]
+        if not formatters:
+            return [dict(zip(names, row)) for row in rows]
+
+        result = []
+        for row in rows:
+            row = list(row)
+            for i, formatter in formatters:
+                row[i] = formatter(row[i])
+            result.append(dict(zip(names, row)))
+        return result
+
+
+_farmer_join = {'farmer': (User, Crop.farmer_id == User.id)}
+
+CROP_LIST = Projection(Crop, {
+    'id': (Crop.id, None, None),
+    'farmer_id': (Crop.farmer_id, None, None),
+    'name': (Crop.name, None, None),
+    'category': (Crop.category, None, None),
+    'quantity': (Crop.quantity, None, None),
+    'unit': (Crop.unit, None, None),
+    'price_per_unit': (Crop.price_per_unit, None, None),
+    'location': (Crop.location, None, None),
+    'county': (Crop.county, None, None),
+    'farmer_name': (User.username, 'farmer', None),
+    'farmer_rating': (User.rating, 'farmer', None),
+    'farmer_total_ratings': (User.total_ratings, 'farmer', None),
+    'image_filename': (Crop.image_filename, None, None),
+    'harvest_date': (Crop.harvest_date, None, _isoformat),
+    'quality_grade': (Crop.quality_grade, None, None),
+    'status': (Crop.status, None, None),
+}, joins=_farmer_join)
+
+CROP_DETAIL = Projection(Crop, {
+    'id': (Crop.id, None, None),
+    'name': (Crop.name, None, None),
+    'category': (Crop.category, None, None),
+    'price_per_unit': (Crop.price_per_unit, None, float),
+    'unit': (Crop.unit, None, None),
+    'quantity': (Crop.quantity, None, float),
+    'location': (Crop.location, None, None),
+    'county': (Crop.county, None, None),
+    'description': (Crop.description, None, None),
+    'status': (Crop.status, None, None),
+    'farmer_id': (Crop.farmer_id, None, None),
+    'farmer_name': (User.username, 'farmer', None),
+    'harvest_date': (Crop.harvest_date, None, _isoformat),
+    'image_filename': (Crop.image_filename, None, None),
+}, joins=_farmer_join)
+
+ORDER_LIST = Projection(Order, {
+    'id': (Order.id, None, None),
+    'crop_id': (Order.crop_id, None, None),
+    'buyer_id': (Order.buyer_id, None, None),
+    'farmer_id': (Order.farmer_id, None, None),
+    'crop_name': (Crop.name, 'crop', None),
+    'quantity': (Order.quantity, None, None),
+    'total_amount': (Order.total_amount, None, None),
+    'status': (Order.status, None, None),
+    'buyer_name': (Buyer.username, 'buyer', None),
+    'farmer_name': (Farmer.username, 'farmer', None),
+    'delivery_date': (Order.delivery_date, None, _isoformat),
+    'created_at': (Order.created_at, None, _isoformat),
+}, joins={
+    'crop': (Crop, Order.crop_id == Crop.id),
+    'buyer': (Buyer, Order.buyer_id == Buyer.id),
+    'farmer': (Farmer, Order.farmer_id == Farmer.id),
+})
+
+USER_LIST = Projection(User, {
+    'id': (User.id, None, None),
+    'username': (User.username, None, None),
+    'email': (User.email, None, None),
+    'user_type': (User.user_type, None, None),
+    'is_admin': (User.is_admin, None, None),
+    'created_at': (User.created_at, None, _isoformat),
+    'rating': (User.rating, None, None),
+})
+
+MESSAGE_LIST = Projection(Message, {
+    'id': (Message.id, None, None),
+    'sender_id': (Message.sender_id, None, None),
+    'receiver_id': (Message.receiver_id, None, None),
+    'order_id': (Message.order_id, None, None),
+    'content': (Message.content, None, None),
+    'message_type': (Message.message_type, None, None),
+    'created_at': (Message.created_at, None, _isoformat),
+    'read_at': (Message.read_at, None, _isoformat),
+})
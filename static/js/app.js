@@ -1,4 +1,75 @@
 // Main application JavaScript
+
+// Local IndexedDB replica of crops, orders and messages kept current via /api/sync
+class SyncStore {
+    constructor(userId) {
+        this.dbName = `agriconnect-${userId}`;
+        this.stores = ['crops', 'orders', 'messages'];
+        this.db = null;
+    }
+
+    open() {
+        if (this.db) return Promise.resolve(this.db);
+        return new Promise((resolve, reject) => {
+            const request = indexedDB.open(this.dbName, 1);
+            request.onupgradeneeded = () => {
+                this.stores.forEach(name => request.result.createObjectStore(name, { keyPath: 'id' }));
+                request.result.createObjectStore('meta');
+            };
+            request.onsuccess = () => resolve(this.db = request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    async getToken() {
+        const db = await this.open();
+        return new Promise((resolve, reject) => {
+            const request = db.transaction('meta').objectStore('meta').get('token');
+            request.onsuccess = () => resolve(request.result || '');
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    async apply(payload) {
+        const db = await this.open();
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction([...this.stores, 'meta'], 'readwrite');
+            this.stores.forEach(name => {
+                const store = tx.objectStore(name);
+                if (payload.reset) store.clear();
+                (payload[name].upserted || []).forEach(row => store.put(row));
+                (payload[name].deleted || []).forEach(id => store.delete(id));
+            });
+            tx.objectStore('meta').put(payload.token, 'token');
+            tx.oncomplete = () => resolve();
+            tx.onerror = () => reject(tx.error);
+        });
+    }
+
+    async sync() {
+        let hasMore = true;
+        while (hasMore) {
+            const token = await this.getToken();
+            const response = await fetch(`/api/sync${token ? `?since=${token}` : ''}`, {
+                credentials: 'include'
+            });
+            if (!response.ok) throw new Error(`Sync failed with status ${response.status}`);
+            const payload = await response.json();
+            await this.apply(payload);
+            hasMore = payload.has_more;
+        }
+    }
+
+    async getAll(name) {
+        const db = await this.open();
+        return new Promise((resolve, reject) => {
+            const request = db.transaction(name).objectStore(name).getAll();
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+}
+
 class AgriMarketplace {
     constructor() {
         this.isOnline = navigator.onLine;
@@ -258,20 +329,27 @@ class AgriMarketplace {
         }
     }
 
+    async loadSyncedData() {
+        // Bring the local replica up to date, then read from it
+        const userId = parseInt(document.body.dataset.userId);
+        if (!this.syncStore) {
+            this.syncStore = new SyncStore(userId);
+        }
+        await this.syncStore.sync();
+        const [crops, orders] = await Promise.all([
+            this.syncStore.getAll('crops'),
+            this.syncStore.getAll('orders')
+        ]);
+        return { userId, crops, orders };
+    }
+
     async loadFarmerData() {
         // Load farmer-specific data
         try {
-            const [cropsResponse, ordersResponse] = await Promise.all([
-                fetch('/api/crops', { credentials: 'include' }),
-                fetch('/api/orders', { credentials: 'include' })
-            ]);
-
-            if (cropsResponse.ok && ordersResponse.ok) {
-                const crops = await cropsResponse.json();
-                const orders = await ordersResponse.json();
-                
-                this.updateDashboardStats('farmer', crops, orders);
-            }
+            const { userId, crops, orders } = await this.loadSyncedData();
+            this.updateDashboardStats('farmer',
+                { crops: crops.filter(crop => crop.farmer_id === userId) },
+                { orders: orders.filter(order => order.farmer_id === userId) });
         } catch (error) {
             console.error('Failed to load farmer data:', error);
         }
@@ -280,17 +358,10 @@ class AgriMarketplace {
     async loadBuyerData() {
         // Load buyer-specific data
         try {
-            const [cropsResponse, ordersResponse] = await Promise.all([
-                fetch('/api/crops', { credentials: 'include' }),
-                fetch('/api/orders', { credentials: 'include' })
-            ]);
-
-            if (cropsResponse.ok && ordersResponse.ok) {
-                const crops = await cropsResponse.json();
-                const orders = await ordersResponse.json();
-                
-                this.updateDashboardStats('buyer', crops, orders);
-            }
+            const { userId, crops, orders } = await this.loadSyncedData();
+            this.updateDashboardStats('buyer',
+                { crops: crops.filter(crop => crop.status === 'available') },
+                { orders: orders.filter(order => order.buyer_id === userId) });
         } catch (error) {
             console.error('Failed to load buyer data:', error);
         }
@@ -7,16 +7,39 @@ class BuyerDashboard {
             max_price: '',
             search: ''
         };
+        this.nextPage = null;
+        this.loadingCrops = false;
+        this.cropsRequest = 0;  // bumped per load so stale responses are dropped
         this.init();
     }
 
     init() {
         this.setupEventListeners();
-        this.loadCrops();
+        this.setupInfiniteScroll();
         this.loadOrders();
         this.setupFilters();
     }
 
+    setupInfiniteScroll() {
+        const container = document.getElementById('crops-list');
+        const sentinel = document.getElementById('crops-sentinel');
+
+        // The first page is rendered by the server; only fetch it if it wasn't
+        if (container && container.dataset.serverRendered) {
+            this.nextPage = sentinel && sentinel.dataset.nextPage ? parseInt(sentinel.dataset.nextPage) : null;
+        } else {
+            this.loadCrops();
+        }
+
+        if (!sentinel || !('IntersectionObserver' in window)) return;
+        const observer = new IntersectionObserver((entries) => {
+            if (entries.some(entry => entry.isIntersecting) && this.nextPage && !this.loadingCrops) {
+                this.loadCrops(this.nextPage);
+            }
+        }, { rootMargin: '400px' });
+        observer.observe(sentinel);
+    }
+
     setupEventListeners() {
         // Crop actions
         document.addEventListener('click', (e) => {
@@ -32,6 +55,9 @@ class BuyerDashboard {
             if (e.target.matches('.pay-order')) {
                 this.initiatePayment(e.target.dataset.orderId);
             }
+            if (e.target.matches('.review-order')) {
+                this.reviewOrder(e.target.dataset.orderId);
+            }
         });
 
         // Filter changes
@@ -94,16 +120,19 @@ class BuyerDashboard {
         this.filters.max_price = document.getElementById('price-filter')?.value || '';
         this.filters.search = document.getElementById('search-crops')?.value || '';
 
-        // Reload crops with filters
+        // Reload crops with filters, starting again from the first page
         this.loadCrops();
     }
 
-    async loadCrops() {
+    async loadCrops(page = 1) {
+        const request = ++this.cropsRequest;
+        this.loadingCrops = true;
         try {
             const params = new URLSearchParams();
             Object.entries(this.filters).forEach(([key, value]) => {
                 if (value) params.append(key, value);
             });
+            params.append('page', page);
 
             const response = await fetch(`/api/crops?${params.toString()}`, {
                 credentials: 'include'
@@ -111,18 +140,29 @@ class BuyerDashboard {
 
             if (response.ok) {
                 const data = await response.json();
-                this.renderCropsList(data.crops || []);
+                // A newer load (e.g. a filter change) started while this one was in flight
+                if (request !== this.cropsRequest) return;
+                this.nextPage = data.has_more ? page + 1 : null;
+                this.renderCropsList(data.crops || [], page > 1);
             }
         } catch (error) {
+            if (request !== this.cropsRequest) return;
             console.error('Failed to load crops:', error);
             window.agriApp.showMessage('Failed to load crops', 'error');
+        } finally {
+            if (request === this.cropsRequest) this.loadingCrops = false;
         }
     }
 
-    renderCropsList(crops) {
+    renderCropsList(crops, append = false) {
         const container = document.getElementById('crops-list');
         if (!container) return;
 
+        if (append) {
+            container.insertAdjacentHTML('beforeend', crops.map(crop => this.renderCropCard(crop)).join(''));
+            return;
+        }
+
         if (crops.length === 0) {
             container.innerHTML = `
                 <div class="text-center py-5">
@@ -134,11 +174,15 @@ class BuyerDashboard {
             return;
         }
 
-        container.innerHTML = crops.map(crop => `
+        container.innerHTML = crops.map(crop => this.renderCropCard(crop)).join('');
+    }
+
+    renderCropCard(crop) {
+        return `
             <div class="col-md-6 col-lg-4 mb-4">
                 <div class="card crop-card">
                     ${crop.image_filename ? `
-                        <img src="/static/uploads/${crop.image_filename}" class="card-img-top crop-image" alt="${crop.name}">
+                        <img src="/static/uploads/${crop.image_filename}" class="card-img-top crop-image" alt="${crop.name}" loading="lazy">
                     ` : `
                         <div class="card-img-top crop-image bg-light d-flex align-items-center justify-content-center">
                             <i class="fas fa-image fa-2x text-muted"></i>
@@ -186,7 +230,7 @@ class BuyerDashboard {
                     </div>
                 </div>
             </div>
-        `).join('');
+        `;
     }
 
     renderStars(rating) {
@@ -273,6 +317,17 @@ class BuyerDashboard {
                                 data-order-id="${order.id}" data-status="paid">
                             Confirm Delivery
                         </button>
+                        <button class="btn btn-sm btn-outline-warning review-order" data-order-id="${order.id}">
+                            <i class="fas fa-star"></i> Rate Farmer
+                        </button>
+                    </div>
+                `;
+            case 'paid':
+                return `
+                    <div class="mt-2">
+                        <button class="btn btn-sm btn-outline-warning review-order" data-order-id="${order.id}">
+                            <i class="fas fa-star"></i> Rate Farmer
+                        </button>
                     </div>
                 `;
             default:
@@ -411,6 +466,29 @@ class BuyerDashboard {
         }
     }
 
+    async reviewOrder(orderId) {
+        const rating = parseInt(prompt('Rate the farmer from 1 to 5 stars:'));
+        if (!(rating >= 1 && rating <= 5)) return;
+        const comment = prompt('Add a comment (optional):') || '';
+
+        try {
+            const response = await fetch(`/api/orders/${orderId}/review`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ rating, comment }),
+                credentials: 'include'
+            });
+
+            const result = await response.json();
+            window.agriApp.showMessage(result.message, result.success ? 'success' : 'error');
+        } catch (error) {
+            console.error('Failed to submit review:', error);
+            window.agriApp.showMessage('Failed to submit review', 'error');
+        }
+    }
+
     viewCropDetails(cropId) {
         window.location.href = `/crop/${cropId}`;
     }
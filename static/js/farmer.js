@@ -1,16 +1,39 @@
 // Farmer-specific functionality
 class FarmerDashboard {
     constructor() {
+        this.nextPage = null;
+        this.loadingCrops = false;
+        this.cropsRequest = 0;  // bumped per load so stale responses are dropped
         this.init();
     }
 
     init() {
         this.setupEventListeners();
-        this.loadCrops();
+        this.setupInfiniteScroll();
         this.loadOrders();
         this.setupCropForm();
     }
 
+    setupInfiniteScroll() {
+        const container = document.getElementById('crops-list');
+        const sentinel = document.getElementById('crops-sentinel');
+
+        // The first page is rendered by the server; only fetch it if it wasn't
+        if (container && container.dataset.serverRendered) {
+            this.nextPage = sentinel && sentinel.dataset.nextPage ? parseInt(sentinel.dataset.nextPage) : null;
+        } else {
+            this.loadCrops();
+        }
+
+        if (!sentinel || !('IntersectionObserver' in window)) return;
+        const observer = new IntersectionObserver((entries) => {
+            if (entries.some(entry => entry.isIntersecting) && this.nextPage && !this.loadingCrops) {
+                this.loadCrops(this.nextPage);
+            }
+        }, { rootMargin: '400px' });
+        observer.observe(sentinel);
+    }
+
     setupEventListeners() {
         // Crop management
         document.addEventListener('click', (e) => {
@@ -55,6 +78,51 @@ class FarmerDashboard {
         if (countyField && !countyField.value) {
             countyField.value = document.body.dataset.userCounty || '';
         }
+
+        // Suggest a price once the crop, county or grade is known
+        form.addEventListener('change', (e) => {
+            if (['name', 'county', 'quality_grade'].includes(e.target.name)) {
+                this.updatePriceSuggestion(form);
+            }
+        });
+    }
+
+    async updatePriceSuggestion(form) {
+        const priceField = form.querySelector('[name="price_per_unit"]');
+        const cropName = form.querySelector('[name="name"]').value.trim();
+        if (!priceField || !cropName) return;
+
+        let hint = form.querySelector('.price-suggestion');
+        if (!hint) {
+            hint = document.createElement('div');
+            hint.className = 'form-text price-suggestion';
+            priceField.parentElement.appendChild(hint);
+        }
+
+        try {
+            const params = new URLSearchParams({
+                crop_name: cropName,
+                county: form.querySelector('[name="county"]').value,
+                quality_grade: form.querySelector('[name="quality_grade"]').value
+            });
+            const response = await fetch(`/api/price-suggestion?${params.toString()}`, {
+                credentials: 'include'
+            });
+            const result = await response.json();
+
+            if (result.success) {
+                const s = result.suggestion;
+                hint.textContent = `Suggested: ${window.agriApp.formatCurrency(s.suggested_price)} ` +
+                    `(typical ${window.agriApp.formatCurrency(s.range_low)} - ${window.agriApp.formatCurrency(s.range_high)})`;
+                if (!priceField.value) {
+                    priceField.placeholder = s.suggested_price;
+                }
+            } else {
+                hint.textContent = '';
+            }
+        } catch (error) {
+            console.error('Failed to load price suggestion:', error);
+        }
     }
 
     validateCropForm(form) {
@@ -105,26 +173,39 @@ class FarmerDashboard {
         if (error) error.remove();
     }
 
-    async loadCrops() {
+    async loadCrops(page = 1) {
+        const request = ++this.cropsRequest;
+        this.loadingCrops = true;
         try {
-            const response = await fetch('/api/crops', {
+            const response = await fetch(`/api/crops?mine=1&page=${page}`, {
                 credentials: 'include'
             });
 
             if (response.ok) {
                 const data = await response.json();
-                this.renderCropsList(data.crops || []);
+                // A newer load (e.g. a filter change) started while this one was in flight
+                if (request !== this.cropsRequest) return;
+                this.nextPage = data.has_more ? page + 1 : null;
+                this.renderCropsList(data.crops || [], page > 1);
             }
         } catch (error) {
+            if (request !== this.cropsRequest) return;
             console.error('Failed to load crops:', error);
             window.agriApp.showMessage('Failed to load crops', 'error');
+        } finally {
+            if (request === this.cropsRequest) this.loadingCrops = false;
         }
     }
 
-    renderCropsList(crops) {
+    renderCropsList(crops, append = false) {
         const container = document.getElementById('crops-list');
         if (!container) return;
 
+        if (append) {
+            container.insertAdjacentHTML('beforeend', crops.map(crop => this.renderCropCard(crop)).join(''));
+            return;
+        }
+
         if (crops.length === 0) {
             container.innerHTML = `
                 <div class="text-center py-5">
@@ -136,11 +217,15 @@ class FarmerDashboard {
             return;
         }
 
-        container.innerHTML = crops.map(crop => `
+        container.innerHTML = crops.map(crop => this.renderCropCard(crop)).join('');
+    }
+
+    renderCropCard(crop) {
+        return `
             <div class="col-md-6 col-lg-4 mb-4">
                 <div class="card crop-card">
                     ${crop.image_filename ? `
-                        <img src="/static/uploads/${crop.image_filename}" class="card-img-top crop-image" alt="${crop.name}">
+                        <img src="/static/uploads/${crop.image_filename}" class="card-img-top crop-image" alt="${crop.name}" loading="lazy">
                     ` : `
                         <div class="card-img-top crop-image bg-light d-flex align-items-center justify-content-center">
                             <i class="fas fa-image fa-2x text-muted"></i>
@@ -169,7 +254,7 @@ class FarmerDashboard {
                     </div>
                 </div>
             </div>
-        `).join('');
+        `;
     }
 
     async loadOrders() {
@@ -0,0 +1,185 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, or_
+from app import db
+from db_routing import RoutingSession
+from models import Crop, Order, Message, ChangeLog
+from serializers import CROP_LIST, ORDER_LIST, MESSAGE_LIST
+
+SYNC_BATCH = 2000  # change log entries per sync response
+SNAPSHOT_BATCH = 2000  # rows per snapshot page
+SNAPSHOT_PREFIX = 'snapshot:'  # marks a token that continues a paged snapshot
+# Log ids are assigned before commit, so a slow transaction can commit a lower
+# id after a client already synced past it. Entries younger than this are held
+# back until concurrent writers have had time to commit.
+SETTLE_SECONDS = 2
+
+TRACKED = {Crop: 'crop', Order: 'order', Message: 'message'}
+
+
+def _audience(obj):
+    """Users who may see a change; None means everyone"""
+    if isinstance(obj, Crop):
+        return [None]
+    if isinstance(obj, Order):
+        return {obj.buyer_id, obj.farmer_id}
+    return {obj.sender_id, obj.receiver_id}
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _log_changes(db_session, flush_context):
+    """Append a change log entry for every tracked row written in this flush"""
+    entries = []
+    for objects, op in ((db_session.new, 'upsert'), (db_session.dirty, 'upsert'), (db_session.deleted, 'delete')):
+        for obj in objects:
+            entity = TRACKED.get(type(obj))
+            if entity is None:
+                continue
+            if op == 'upsert' and obj not in db_session.new and not db_session.is_modified(obj):
+                continue
+            entries.extend({'entity': entity, 'entity_id': obj.id, 'op': op, 'user_id': user_id}
+                           for user_id in _audience(obj))
+    if entries:
+        db_session.connection().execute(ChangeLog.__table__.insert(), entries)
+
+
+def _visible(user):
+    return or_(ChangeLog.user_id.is_(None), ChangeLog.user_id == user.id)
+
+
+def _settled():
+    return ChangeLog.created_at < datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+
+
+def _own_fields(projection):
+    """Fields read from the entity's own row.
+
+    Joined fields (farmer_name, farmer_rating, crop_name, ...) change
+    without a change log entry for this entity, e.g. when a review updates
+    the farmer's rating, so a synced copy of them would go stale.
+    """
+    return [name for name in projection.default if projection.fields[name][1] is None]
+
+
+def _rows(projection, condition):
+    fields = _own_fields(projection)
+    return projection.serialize(db.session.execute(projection.select(fields).where(condition)), fields)
+
+
+def _fetch(projection, model, ids):
+    return _rows(projection, model.id.in_(ids)) if ids else []
+
+
+# Snapshot pages walk these in order, each by ascending id
+SNAPSHOT_SOURCES = [
+    ('crops', CROP_LIST, Crop, lambda user: or_(Crop.status == 'available', Crop.farmer_id == user.id)),
+    ('orders', ORDER_LIST, Order, lambda user: or_(Order.buyer_id == user.id, Order.farmer_id == user.id)),
+    ('messages', MESSAGE_LIST, Message, lambda user: or_(Message.sender_id == user.id,
+                                                         Message.receiver_id == user.id)),
+]
+
+
+def parse_token(value):
+    """Sync token -> log id, or (log id, source index, last id) mid-snapshot.
+
+    Raises ValueError for a malformed token.
+    """
+    if value.startswith(SNAPSHOT_PREFIX):
+        token, index, after = (int(part) for part in value[len(SNAPSHOT_PREFIX):].split(':'))
+        if not 0 <= index < len(SNAPSHOT_SOURCES):
+            raise ValueError(value)
+        return token, index, after
+    return int(value)
+
+
+def snapshot(user, cursor=None):
+    """One page of everything a client replica starts from.
+
+    The first page has ``reset`` set and records the log token to sync
+    from once the snapshot is done; the token of each page continues the
+    snapshot until the last page hands back that log token.
+    """
+    if cursor is None:
+        # Rows read below may be newer than the token; replaying them is harmless
+        token = db.session.query(func.max(ChangeLog.id)).filter(_settled()).scalar() or 0
+        cursor = (token, 0, 0)
+    token, index, after = cursor
+
+    name, projection, model, condition = SNAPSHOT_SOURCES[index]
+    fields = _own_fields(projection)
+    stmt = projection.select(fields).where(condition(user), model.id > after) \
+        .order_by(model.id).limit(SNAPSHOT_BATCH + 1)
+    rows = projection.serialize(db.session.execute(stmt), fields)
+    more_rows = len(rows) > SNAPSHOT_BATCH
+    rows = rows[:SNAPSHOT_BATCH]
+
+    if more_rows:
+        next_token = f'{SNAPSHOT_PREFIX}{token}:{index}:{rows[-1]["id"]}'
+    elif index + 1 < len(SNAPSHOT_SOURCES):
+        next_token = f'{SNAPSHOT_PREFIX}{token}:{index + 1}:0'
+    else:
+        next_token = str(token)
+
+    payload = {
+        'token': next_token,
+        'reset': after == 0 and index == 0,
+        'has_more': next_token != str(token),
+    }
+    for source in SNAPSHOT_SOURCES:
+        payload[source[0]] = {'upserted': rows if source[0] == name else [], 'deleted': []}
+    return payload
+
+
+def changes_since(user, since):
+    """Net changes visible to user after token ``since``.
+
+    Several changes to the same row collapse into one entry, and upserted
+    rows are fetched in one query per entity type.
+    """
+    oldest, newest = db.session.query(func.min(ChangeLog.id), func.max(ChangeLog.id)).one()
+    if oldest is not None and since < oldest - 1:
+        # The log was pruned past the client's token; start over
+        return snapshot(user)
+    if since > (newest or 0):
+        # A token from before the log was reset, e.g. a database restore
+        return snapshot(user)
+
+    entries = db.session.query(ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op) \
+        .filter(ChangeLog.id > since, _visible(user), _settled()) \
+        .order_by(ChangeLog.id).limit(SYNC_BATCH + 1).all()
+    has_more = len(entries) > SYNC_BATCH
+    entries = entries[:SYNC_BATCH]
+
+    latest = {}
+    for _, entity, entity_id, op in entries:
+        latest[(entity, entity_id)] = op
+
+    def split(entity):
+        upserted = [i for (e, i), op in latest.items() if e == entity and op == 'upsert']
+        deleted = [i for (e, i), op in latest.items() if e == entity and op == 'delete']
+        return upserted, deleted
+
+    crop_ids, deleted_crops = split('crop')
+    order_ids, deleted_orders = split('order')
+    message_ids, deleted_messages = split('message')
+
+    return {
+        'token': str(entries[-1][0] if entries else since),
+        'reset': False,
+        'has_more': has_more,
+        'crops': {'upserted': _fetch(CROP_LIST, Crop, crop_ids), 'deleted': deleted_crops},
+        'orders': {'upserted': _fetch(ORDER_LIST, Order, order_ids), 'deleted': deleted_orders},
+        'messages': {'upserted': _fetch(MESSAGE_LIST, Message, message_ids), 'deleted': deleted_messages},
+    }
+
+
+def prune(before):
+    """Drop change log entries older than ``before``; clients behind it resync.
+
+    The newest entry is always kept so ids (and so tokens) never go back
+    to 1, even on SQLite tables created without AUTOINCREMENT.
+    """
+    newest = db.session.query(func.max(ChangeLog.id)).scalar()
+    deleted = ChangeLog.query.filter(ChangeLog.created_at < before, ChangeLog.id != newest) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return deleted